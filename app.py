@@ -1,20 +1,29 @@
+import json
+import logging
 import subprocess
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
 from dash.exceptions import PreventUpdate
+import flask
+import plotly
 
 
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
-from utils import get_df, process_df, get_frame
+import clientside
+import config
+import data
+import export
+import memory
+import metrics
+from encoding import compact_figure
+from figure_cache import FigureCache
 from my_dash_functions import total_vs_time, new_vs_time, new_vs_total
-from my_dash_functions import landskap
-
-import requests
+from my_dash_functions import region_traces, regions_vs_time
 
 
 # Colors
@@ -28,45 +37,41 @@ dropdown_style = {
     "color": "white",
     "background-color": "#00bc8c",
 }
+graph_style = dict(gridcolor=gridcolor, extra_layout_vars=extra_layout_vars)
+
+
+def message_figure(text):
+    """Empty figure showing `text`, e.g. while the data is loading."""
+    layout = dict(
+        annotations=[dict(text=text, showarrow=False, font=dict(size=18))],
+        xaxis=dict(visible=False),
+        yaxis=dict(visible=False),
+        autosize=True,
+        width=800,
+        height=600,
+    )
+    layout.update(extra_layout_vars)
+    return {"data": [], "layout": layout}
 
 
-df_conf_all = process_df(get_frame("confirmed"))
-df_deaths_all = process_df(get_frame("deaths"))
-all_countries = list(df_conf_all.keys())
-
-country_options = [{"label": country, "value": country} for country in all_countries]
+LOADING = "Loading data..."
 
-# Get Swedish data
-url = "https://www.arcgis.com/sharing/rest/content/items/b5e7488e117749c19881cce45db13f7e/data"
-rr = requests.get(url)
-sheet = pd.read_excel(rr.content)
+GRAPHS = ("graph1", "graph2", "graph3", "graph_sweden", "graph_us")
 
-population_data = pd.read_csv("external/WPP2019_TotalPopulationBySex.csv")
 
-# Only keep relevant data
-year = 2020
-variant = "Medium"
-population_data = population_data[
-    (population_data["Time"] == year) & (population_data["Variant"] == variant)
-]
+logging.basicConfig(level=logging.INFO)
 
+# Confirmed cases, deaths, Swedish and population data, kept up to date in the
+# background. With a lazy start the layout is served right away and the graphs
+# show a loading notice until the data has been loaded in the background.
+if config.LAZY_START:
+    data.start_loading()
+else:
+    data.swap(data.load_or_attach())
 
-def per_capita_norm(df):
-    for ii, col in enumerate(df.iteritems()):
-        if col[0] == "US":
-            location = "United States of America"
-        elif col[0] == "UK":
-            location = "United Kingdom"
-        else:
-            location = col[0]
-        df.iloc[:, ii] = (
-            col[1]
-            / population_data[population_data["Location"] == location][
-                "PopTotal"
-            ].values
-            * 100
-        )  # x100 to get per 100 000
-    return df
+# Figures for the most recently requested inputs, emptied when data refreshes
+figure_cache = FigureCache(config.FIGURE_CACHE_SIZE)
+data.on_swap(lambda dataset: figure_cache.clear())
 
 
 # Pick countries to plot
@@ -87,226 +92,211 @@ def get_start_conutries():
 
 start_countries = get_start_conutries()
 
-# Filter DataFrames
-df_conf = df_conf_all[start_countries]
-df_deaths = df_deaths_all[start_countries]
+
+def initial_options(dataset):
+    """Options of the country dropdown, only the start countries until loaded."""
+    if dataset is None:
+        return [{"label": country, "value": country} for country in start_countries]
+    return dataset.country_options
+
+
+def us_state_options(dataset):
+    """Options of the US state dropdown, none until loaded or without US data."""
+    if dataset is None or dataset.us is None:
+        return []
+    return [{"label": state, "value": state} for state in sorted(dataset.us.parents)]
+
+
+def default_figures(dataset):
+    """Figures of all graphs for the initial values of the controls.
+
+    They are computed through the figure cache, where the callbacks find them
+    once the controls are changed back to these values.
+    """
+    if dataset is None:
+        loading = message_figure(LOADING)
+        return {graph: loading for graph in GRAPHS}
+    countries = tuple(sorted(start_countries))
+    cases = "confirmed cases"
+    return dict(
+        graph1=figure1(dataset, countries, cases, "linear", "per capita"),
+        graph2=figure2(dataset, countries, cases, "linear", "per capita", 7),
+        graph3=figure3(dataset, countries, cases, 7, "total"),
+        graph_sweden=figure4(dataset, "new", "linear", 7),
+        graph_us=figure_us(dataset, None, "confirmed", "new", "per capita", 7),
+    )
+
 
 # style sheets for dash app
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 
+
+class CovidDash(dash.Dash):
+    """`dash.Dash` serializing the layout once per data version, see `serve_layout`.
+
+    The layout embeds the default figures, so it is large and serializing it
+    for every page view would cost more than building it.
+    """
+
+    _layout_json = (None, None)  # layout, its JSON
+
+    def serve_layout(self):
+        layout = self._layout_value()
+        if self._layout_json[0] is not layout:
+            body = json.dumps(
+                layout, cls=plotly.utils.PlotlyJSONEncoder, separators=(",", ":")
+            )
+            self._layout_json = (layout, body)
+        return flask.Response(self._layout_json[1], mimetype="application/json")
+
+
 # dash app starts here
-app = dash.Dash(__name__)  # , external_stylesheets=external_stylesheets)
+app = CovidDash(__name__)  # , external_stylesheets=external_stylesheets)
 
 server = app.server
 
-app.layout = html.Div(
-    [
-        dcc.Markdown(
-            """
-    # Covid-19 data visualization
-
-    > *by Eric Wulff*
 
-    The visualizations presented here are based on data from the Johns Hopkins
-    University's GitHub [repository](https://github.com/CSSEGISandData/COVID-19).
+def graph_callback(*args, **kwargs):
+    """`app.callback` for the graphs computed in the browser in client-side mode."""
+    if config.CLIENTSIDE:
+        return lambda func: func
+    return app.callback(*args, **kwargs)
 
-    The data presented under **A closer look at Sweden** is taken from the
-    Swedish Health Authorities'
-    [website](https://www.folkhalsomyndigheten.se/smittskydd-beredskap/utbrott/aktuella-utbrott/covid-19/bekraftade-fall-i-sverige/)
-    (www.folkhalsomyndigheten.se). More specifically, data from [this](https://www.arcgis.com/sharing/rest/content/items/b5e7488e117749c19881cce45db13f7e/data)
-    download link is used.
 
-    The source code of this app is published on GitHub
-    [here](https://github.com/erwulff/covid-19_data_exploration).
+def build_layout(dataset):
+    """The layout of the app, with the figures for the initial controls embedded.
 
-    Use the search box to add countries to the graphs or click on
-    **Default Countries** or **Scandinavian Countries** to populate the graphs with a
-    predefined set of countries.
+    The page is then drawn without any callback, see `serve_layout`.
     """
-        ),
-        html.Div(
-            [
-                dcc.Dropdown(
-                    placeholder="Search countries...",
-                    id="country_dropdown",
-                    multi=True,
-                    options=country_options,
-                    value=start_countries,
-                    style=dropdown_style,
-                ),
-            ],
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                html.Button("Default countries", id="reset_button", n_clicks=0),
-                html.Button("Scandinavian countries", id="button1", n_clicks=0),
-            ],
-            style=dict(padding_top="100px"),
-        ),
-        html.Div(
-            [
-                dcc.Markdown(
-                    """
-                     ## Total confirmed cases/deaths
-                     Click on countries in the legend to hide or show them
-                     """
-                ),
-            ],
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                html.Div(
-                    dcc.Dropdown(
-                        id="dropdown",
-                        options=[
-                            {"label": "Deaths", "value": "deaths"},
-                            {"label": "Confirmed cases", "value": "confirmed cases"},
-                        ],
-                        value="confirmed cases",
-                        style=dropdown_style,
-                    ),
-                    className="three columns",
-                ),
-                html.Div(
+    figures = default_figures(dataset)
+    version = None if dataset is None else dataset.version
+
+    layout = html.Div(
+        [
+            dcc.Markdown(
+                """
+        # Covid-19 data visualization
+
+        > *by Eric Wulff*
+
+        The visualizations presented here are based on data from the Johns Hopkins
+        University's GitHub [repository](https://github.com/CSSEGISandData/COVID-19).
+
+        The data presented under **A closer look at Sweden** is taken from the
+        Swedish Health Authorities'
+        [website](https://www.folkhalsomyndigheten.se/smittskydd-beredskap/utbrott/aktuella-utbrott/covid-19/bekraftade-fall-i-sverige/)
+        (www.folkhalsomyndigheten.se). More specifically, data from [this](https://www.arcgis.com/sharing/rest/content/items/b5e7488e117749c19881cce45db13f7e/data)
+        download link is used.
+
+        The source code of this app is published on GitHub
+        [here](https://github.com/erwulff/covid-19_data_exploration).
+
+        Use the search box to add countries to the graphs or click on
+        **Default Countries** or **Scandinavian Countries** to populate the graphs with a
+        predefined set of countries.
+        """
+            ),
+            html.Div(
+                [
                     dcc.Dropdown(
-                        id="axis_dropdown",
-                        options=[
-                            {"label": "Linear", "value": "linear"},
-                            {"label": "Logarithmic", "value": "log"},
-                        ],
-                        value="linear",
+                        placeholder="Search countries...",
+                        id="country_dropdown",
+                        multi=True,
+                        options=initial_options(dataset),
+                        value=start_countries,
                         style=dropdown_style,
                     ),
-                    className="three columns",
-                ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="norm_dropdown",
-                        options=[
-                            {"label": "Per 100,000", "value": "per capita"},
-                            {"label": "Total", "value": "total"},
-                        ],
-                        value="per capita",
-                        style=dropdown_style,
+                ],
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    html.Button("Default countries", id="reset_button", n_clicks=0),
+                    html.Button("Scandinavian countries", id="button1", n_clicks=0),
+                ],
+                style=dict(padding_top="100px"),
+            ),
+            html.Div(
+                [
+                    dcc.Markdown(
+                        """
+                         ## Total confirmed cases/deaths
+                         Click on countries in the legend to hide or show them
+                         """
                     ),
-                    className="three columns",
-                ),
-            ],
-            className="row",
-        ),
-        html.Div(
-            dcc.Graph(
-                id="graph1", style={"height": "600px", "width": "85vw"}, responsive=True
+                ],
+                className="twelve columns",
             ),
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                dcc.Markdown(
-                    """
-        ## New confirmed cases/deaths per day
-        Click on countries in the legend to hide or show them
-
-        """
-                ),
-            ],
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                html.Div(
-                    dcc.Dropdown(
-                        id="dropdown2",
-                        options=[
-                            {"label": "Deaths", "value": "deaths"},
-                            {"label": "Confirmed cases", "value": "confirmed cases"},
-                        ],
-                        value="confirmed cases",
-                        style=dropdown_style,
+            html.Div(
+                [
+                    html.Div(
+                        dcc.Dropdown(
+                            id="dropdown",
+                            options=[
+                                {"label": "Deaths", "value": "deaths"},
+                                {
+                                    "label": "Confirmed cases",
+                                    "value": "confirmed cases",
+                                },
+                            ],
+                            value="confirmed cases",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
                     ),
-                    className="three columns",
-                ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="axis_dropdown2",
-                        options=[
-                            {"label": "Linear", "value": "linear"},
-                            {"label": "Logarithmic", "value": "log"},
-                        ],
-                        value="linear",
-                        style=dropdown_style,
+                    html.Div(
+                        dcc.Dropdown(
+                            id="axis_dropdown",
+                            options=[
+                                {"label": "Linear", "value": "linear"},
+                                {"label": "Logarithmic", "value": "log"},
+                            ],
+                            value="linear",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
                     ),
-                    className="three columns",
-                ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="norm_dropdown2",
-                        options=[
-                            {"label": "Per 100,000", "value": "per capita"},
-                            {"label": "Total", "value": "total"},
-                        ],
-                        value="per capita",
-                        style=dropdown_style,
+                    html.Div(
+                        dcc.Dropdown(
+                            id="norm_dropdown",
+                            options=[
+                                {"label": "Per 100,000", "value": "per capita"},
+                                {"label": "Total", "value": "total"},
+                            ],
+                            value="per capita",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
                     ),
-                    className="three columns",
+                ],
+                className="row",
+            ),
+            html.Div(
+                dcc.Graph(
+                    id="graph1",
+                    figure=figures["graph1"],
+                    style={"height": "600px", "width": "85vw"},
+                    responsive=True,
                 ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="window_selector",
-                        options=[
-                            {
-                                "label": "Rolling mean: {}".format(ii + 1),
-                                "value": ii + 1,
-                            }
-                            for ii in range(14)
-                        ],
-                        value=7,
-                        style=dropdown_style,
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    dcc.Markdown(
+                        """
+            ## New confirmed cases/deaths per day
+            Click on countries in the legend to hide or show them
+
+            """
                     ),
-                    className="three columns",
-                ),
-            ],
-            className="row",
-        ),
-        html.Div(
-            dcc.Graph(
-                id="graph2", style={"height": "600px", "width": "85vw"}, responsive=True
+                ],
+                className="twelve columns",
             ),
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                dcc.Markdown(
-                    """
-        ## New vs. total confirmed cases/deaths
-
-        If the growth of something is proportional to its prevalence the growth
-        is exponential. This results in that the growth
-        is accelerating with time.
-
-        In terms of a pandemic this translates to that the number of newly
-        infected people per day is proportional to the total number of infected
-        people. Therefore exponential growth appears as a straight line if you
-        plot the new cases against the total cases. The steepness of this line
-        corresponds to the growth rate.
-
-        This plot makes it easy to see which countries have managed to
-        break the exponential trend, thus plummeting towards fewer new cases per
-        day.
-        Click on countries in the legend to hide or show them
-        """
-                ),
-            ],
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                html.Div(
-                    [
+            html.Div(
+                [
+                    html.Div(
                         dcc.Dropdown(
-                            id="dropdown3",
+                            id="dropdown2",
                             options=[
                                 {"label": "Deaths", "value": "deaths"},
                                 {
@@ -317,169 +307,407 @@ app.layout = html.Div(
                             value="confirmed cases",
                             style=dropdown_style,
                         ),
-                    ],
-                    className="three columns",
+                        className="three columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="axis_dropdown2",
+                            options=[
+                                {"label": "Linear", "value": "linear"},
+                                {"label": "Logarithmic", "value": "log"},
+                            ],
+                            value="linear",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="norm_dropdown2",
+                            options=[
+                                {"label": "Per 100,000", "value": "per capita"},
+                                {"label": "Total", "value": "total"},
+                            ],
+                            value="per capita",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="window_selector",
+                            options=[
+                                {
+                                    "label": "Rolling mean: {}".format(ii + 1),
+                                    "value": ii + 1,
+                                }
+                                for ii in range(14)
+                            ],
+                            value=7,
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
+                    ),
+                ],
+                className="row",
+            ),
+            html.Div(
+                dcc.Graph(
+                    id="graph2",
+                    figure=figures["graph2"],
+                    style={"height": "600px", "width": "85vw"},
+                    responsive=True,
                 ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="norm_dropdown3",
-                        options=[
-                            {"label": "Total", "value": "total"},
-                            {"label": "Per 100,000", "value": "per capita"},
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    dcc.Markdown(
+                        """
+            ## New vs. total confirmed cases/deaths
+
+            If the growth of something is proportional to its prevalence the growth
+            is exponential. This results in that the growth
+            is accelerating with time.
+
+            In terms of a pandemic this translates to that the number of newly
+            infected people per day is proportional to the total number of infected
+            people. Therefore exponential growth appears as a straight line if you
+            plot the new cases against the total cases. The steepness of this line
+            corresponds to the growth rate.
+
+            This plot makes it easy to see which countries have managed to
+            break the exponential trend, thus plummeting towards fewer new cases per
+            day.
+            Click on countries in the legend to hide or show them
+            """
+                    ),
+                ],
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            dcc.Dropdown(
+                                id="dropdown3",
+                                options=[
+                                    {"label": "Deaths", "value": "deaths"},
+                                    {
+                                        "label": "Confirmed cases",
+                                        "value": "confirmed cases",
+                                    },
+                                ],
+                                value="confirmed cases",
+                                style=dropdown_style,
+                            ),
                         ],
-                        value="total",
-                        style=dropdown_style,
+                        className="three columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="norm_dropdown3",
+                            options=[
+                                {"label": "Total", "value": "total"},
+                                {"label": "Per 100,000", "value": "per capita"},
+                            ],
+                            value="total",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="window_selector2",
+                            options=[
+                                {
+                                    "label": "Rolling mean: {}".format(ii + 1),
+                                    "value": ii + 1,
+                                }
+                                for ii in range(14)
+                            ],
+                            value=7,
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
                     ),
-                    className="three columns",
+                ],
+                className="row",
+            ),
+            html.Div(
+                dcc.Graph(
+                    id="graph3",
+                    figure=figures["graph3"],
+                    style={"height": "600px", "width": "85vw"},
+                    responsive=True,
                 ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="window_selector2",
-                        options=[
-                            {
-                                "label": "Rolling mean: {}".format(ii + 1),
-                                "value": ii + 1,
-                            }
-                            for ii in range(14)
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    dcc.Markdown(
+                        """
+            ## A closer look at Sweden
+            Click on regions in the legend to hide or show them
+
+            Data presented here is taken from the Swedish Health Authorities'
+            [website](https://www.folkhalsomyndigheten.se/smittskydd-beredskap/utbrott/aktuella-utbrott/covid-19/bekraftade-fall-i-sverige/)
+            (www.folkhalsomyndigheten.se).
+            """
+                    ),
+                ],
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            dcc.Dropdown(
+                                id="dropdown_sweden",
+                                options=[
+                                    {"label": "New cases", "value": "new"},
+                                    {"label": "Total cases", "value": "total"},
+                                ],
+                                value="new",
+                                style=dropdown_style,
+                            ),
                         ],
-                        value=7,
-                        style=dropdown_style,
+                        className="three columns",
                     ),
-                    className="three columns",
-                ),
-            ],
-            className="row",
-        ),
-        html.Div(
-            dcc.Graph(
-                id="graph3", style={"height": "600px", "width": "85vw"}, responsive=True
+                    html.Div(
+                        dcc.Dropdown(
+                            id="axis_dropdown_sweden",
+                            options=[
+                                {"label": "Linear", "value": "linear"},
+                                {"label": "Logarithmic", "value": "log"},
+                            ],
+                            value="linear",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="window_selector_sweden",
+                            options=[
+                                {
+                                    "label": "Rolling mean: {}".format(ii + 1),
+                                    "value": ii + 1,
+                                }
+                                for ii in range(14)
+                            ],
+                            value=7,
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
+                    ),
+                ],
+                className="row",
             ),
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                dcc.Markdown(
-                    """
-        ## A closer look at Sweden
-        Click on regions in the legend to hide or show them
-
-        Data presented here is taken from the Swedish Health Authorities'
-        [website](https://www.folkhalsomyndigheten.se/smittskydd-beredskap/utbrott/aktuella-utbrott/covid-19/bekraftade-fall-i-sverige/)
-        (www.folkhalsomyndigheten.se).
-        """
+            html.Div(
+                dcc.Graph(
+                    id="graph_sweden",
+                    figure=figures["graph_sweden"],
+                    style={"height": "600px", "width": "85vw"},
+                    responsive=True,
                 ),
-            ],
-            className="twelve columns",
-        ),
-        html.Div(
-            [
-                html.Div(
-                    [
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    dcc.Markdown(
+                        """
+            ## A closer look at the US
+            Pick a state to see its counties, or clear it to compare the states.
+            Click on regions in the legend to hide or show them
+            """
+                    ),
+                ],
+                className="twelve columns",
+            ),
+            html.Div(
+                [
+                    html.Div(
+                        dcc.Dropdown(
+                            id="us_state_dropdown",
+                            options=us_state_options(dataset),
+                            placeholder="All states",
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
+                    ),
+                    html.Div(
                         dcc.Dropdown(
-                            id="dropdown_sweden",
+                            id="us_cases_dropdown",
                             options=[
-                                {"label": "New cases", "value": "new"},
-                                {"label": "Total cases", "value": "total"},
+                                {"label": "Deaths", "value": "deaths"},
+                                {"label": "Confirmed cases", "value": "confirmed"},
+                            ],
+                            value="confirmed",
+                            style=dropdown_style,
+                        ),
+                        className="two columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="us_kind_dropdown",
+                            options=[
+                                {"label": "New", "value": "new"},
+                                {"label": "Total", "value": "total"},
                             ],
                             value="new",
                             style=dropdown_style,
                         ),
-                    ],
-                    className="three columns",
-                ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="axis_dropdown_sweden",
-                        options=[
-                            {"label": "Linear", "value": "linear"},
-                            {"label": "Logarithmic", "value": "log"},
-                        ],
-                        value="linear",
-                        style=dropdown_style,
+                        className="two columns",
                     ),
-                    className="three columns",
-                ),
-                html.Div(
-                    dcc.Dropdown(
-                        id="window_selector_sweden",
-                        options=[
-                            {
-                                "label": "Rolling mean: {}".format(ii + 1),
-                                "value": ii + 1,
-                            }
-                            for ii in range(14)
-                        ],
-                        value=7,
-                        style=dropdown_style,
+                    html.Div(
+                        dcc.Dropdown(
+                            id="us_norm_dropdown",
+                            options=[
+                                {"label": "Per 100,000", "value": "per capita"},
+                                {"label": "Total", "value": "total"},
+                            ],
+                            value="per capita",
+                            style=dropdown_style,
+                        ),
+                        className="two columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="us_window_selector",
+                            options=[
+                                {
+                                    "label": "Rolling mean: {}".format(ii + 1),
+                                    "value": ii + 1,
+                                }
+                                for ii in range(14)
+                            ],
+                            value=7,
+                            style=dropdown_style,
+                        ),
+                        className="three columns",
                     ),
-                    className="three columns",
+                ],
+                className="row",
+            ),
+            html.Div(
+                dcc.Graph(
+                    id="graph_us",
+                    figure=figures["graph_us"],
+                    style={"height": "600px", "width": "85vw"},
+                    responsive=True,
                 ),
-            ],
-            className="row",
-        ),
-        html.Div(
-            dcc.Graph(
-                id="graph_sweden",
-                style={"height": "600px", "width": "85vw"},
-                responsive=True,
+                className="twelve columns",
             ),
-            className="twelve columns",
-        ),
-    ]
+        ]
+    )
+
+    # Version of the data the graphs show. Polled until the data is loaded when
+    # starting lazily, the graphs are then drawn again.
+    layout.children.extend(
+        [
+            dcc.Store(id="data_version", data=version),
+            dcc.Store(id="selection", data=sorted(start_countries)),
+            dcc.Interval(id="data_poll", interval=1000, disabled=version is not None),
+        ]
+    )
+
+    if config.CLIENTSIDE:
+        layout.children.extend(
+            clientside.components(dataset, start_countries, graph_style)
+        )
+    return layout
+
+
+# Layout of the current data version, built once per version
+_layout = (None, None)
+
+
+def serve_layout():
+    """Return the layout for a page view, built once per data version."""
+    global _layout
+    dataset = data.current()
+    version = None if dataset is None else dataset.version
+    if _layout[1] is None or _layout[0] != version:
+        _layout = (version, build_layout(dataset))
+    return _layout[1]
+
+
+if config.CLIENTSIDE:
+    clientside.register(app, data.current, graph_style)
+
+
+@app.callback(
+    [Output("data_version", "data"), Output("data_poll", "disabled")],
+    [Input("data_poll", "n_intervals")],
+    prevent_initial_call=True,
 )
+def poll_data(n_intervals):
+    dataset = data.current()
+    if dataset is None:
+        raise PreventUpdate
+    return dataset.version, True
 
 
 @app.callback(
     Output("country_dropdown", "options"),
     [Input("country_dropdown", "search_value")],
     [State("country_dropdown", "value")],
+    prevent_initial_call=True,
 )
 def update_multi_options(search_value, value):
-    if not search_value:
+    dataset = data.current()
+    if not search_value or dataset is None:
         raise PreventUpdate
+    country_search = dataset.country_search
     # Make sure that the set values are in the option list, else they will disappear
     # from the shown select list, but still part of the `value`.
-    return [
-        o
-        for o in country_options
-        if (search_value in o["label"] or o["value"] in (value or []))
-        or (search_value.capitalize() in o["label"] or o["value"] in (value or []))
-    ]
+    value = value or []
+    matches = country_search.search(search_value)
+    return country_search.get(value) + [o for o in matches if o["value"] not in value]
 
 
-@app.callback(
+@graph_callback(
     Output("graph1", "figure"),
     [
         Input("dropdown", "value"),
         Input("axis_dropdown", "value"),
-        Input("country_dropdown", "value"),
+        Input("selection", "data"),
         Input("norm_dropdown", "value"),
-        Input("button1", "n_clicks"),
-        Input("reset_button", "n_clicks"),
+        Input("data_version", "data"),
     ],
+    prevent_initial_call=True,
 )
 def update_figure(
-    selected_cases, selected_axis_type, selected_countries, selected_norm, button, reset
+    selected_cases,
+    selected_axis_type,
+    selected_countries,
+    selected_norm,
+    data_version,
 ):
-    changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
-    if "button1" in changed_id:
-        selected_countries = ["Sweden", "Denmark", "Finland", "Norway"]
-        selected_countries.sort()
-    elif "reset_button" in changed_id or (
-        reset == 0 and button == 0 and selected_countries == get_start_conutries()
-    ):
-        selected_countries = start_countries
-        selected_countries.sort()
+    dataset = data.current()
+    if dataset is None:
+        return message_figure(LOADING)
+    return figure1(
+        dataset,
+        tuple(sorted(selected_countries or [])),
+        selected_cases,
+        selected_axis_type,
+        selected_norm,
+    )
 
-    if selected_cases == "confirmed cases":
-        df = df_conf_all[selected_countries]
-    elif selected_cases == "deaths":
-        df = df_deaths_all[selected_countries]
 
-    if selected_norm == "per capita":
-        df = per_capita_norm(df)
+@figure_cache.memoize
+def figure1(dataset, countries, selected_cases, selected_axis_type, selected_norm):
+    df = dataset.cube.select(countries).frame("total", selected_cases, selected_norm, 1)
 
-    traces, layout = total_vs_time(df, descr=selected_cases)
+    traces, layout = total_vs_time(
+        df,
+        descr=selected_cases,
+        dates=dataset.dates,
+        max_points=config.downsample_points("graph1"),
+        method=config.DOWNSAMPLE_METHOD,
+    )
 
     # Set the miminum range on the y-axis when using log scale to avoid outliers dominating the plot
     if selected_axis_type == "log":
@@ -499,23 +727,20 @@ def update_figure(
         )
     )
     layout.update(extra_layout_vars)
-    return {
-        "data": traces,
-        "layout": layout,
-    }
+    return compact_figure({"data": traces, "layout": layout}, daily_x=dataset.daily)
 
 
-@app.callback(
+@graph_callback(
     Output("graph2", "figure"),
     [
         Input("dropdown2", "value"),
         Input("axis_dropdown2", "value"),
         Input("norm_dropdown2", "value"),
         Input("window_selector", "value"),
-        Input("country_dropdown", "value"),
-        Input("button1", "n_clicks"),
-        Input("reset_button", "n_clicks"),
+        Input("selection", "data"),
+        Input("data_version", "data"),
     ],
+    prevent_initial_call=True,
 )
 def update_figure2(
     selected_cases,
@@ -523,29 +748,42 @@ def update_figure2(
     selected_norm,
     selected_window,
     selected_countries,
-    button,
-    reset,
+    data_version,
 ):
-    changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
-    if "button1" in changed_id:
-        selected_countries = ["Sweden", "Denmark", "Finland", "Norway"]
-        selected_countries.sort()
-    # Checking if buttons have 0 clicks makes sure the figures are rendered correctly first time app loads
-    elif "reset_button" in changed_id or (
-        reset == 0 and button == 0 and selected_countries == get_start_conutries()
-    ):
-        selected_countries = start_countries
-        selected_countries.sort()
+    dataset = data.current()
+    if dataset is None:
+        return message_figure(LOADING)
+    return figure2(
+        dataset,
+        tuple(sorted(selected_countries or [])),
+        selected_cases,
+        selected_axis_type,
+        selected_norm,
+        selected_window,
+    )
 
-    if selected_cases == "confirmed cases":
-        df = df_conf_all[selected_countries]
-    elif selected_cases == "deaths":
-        df = df_deaths_all[selected_countries]
 
-    if selected_norm == "per capita":
-        df = per_capita_norm(df)
+@figure_cache.memoize
+def figure2(
+    dataset,
+    countries,
+    selected_cases,
+    selected_axis_type,
+    selected_norm,
+    selected_window,
+):
+    new = dataset.cube.select(countries).frame(
+        "new", selected_cases, selected_norm, selected_window
+    )
 
-    traces, layout = new_vs_time(df, descr=selected_cases, window=selected_window)
+    traces, layout = new_vs_time(
+        new,
+        descr=selected_cases,
+        window=selected_window,
+        dates=dataset.dates,
+        max_points=config.downsample_points("graph2"),
+        method=config.DOWNSAMPLE_METHOD,
+    )
 
     # Set the miminum range on the y-axis when using log scale to avoid outliers dominating the plot
     if selected_axis_type == "log":
@@ -565,15 +803,23 @@ def update_figure2(
         )
     )
     layout.update(extra_layout_vars)
-    return {
-        "data": traces,
-        "layout": layout,
-    }
+    return compact_figure({"data": traces, "layout": layout}, daily_x=dataset.daily)
+
+
+# Countries of the first three graphs. Set in the browser, without a request,
+# the graphs then share the columns of the selection, see `cube.Cube.select`.
+app.clientside_callback(
+    ClientsideFunction("covid", "selection"),
+    Output("selection", "data"),
+    [Input("country_dropdown", "value")],
+    prevent_initial_call=True,
+)
 
 
 @app.callback(
     Output("country_dropdown", "value"),
     [Input("button1", "n_clicks"), Input("reset_button", "n_clicks")],
+    prevent_initial_call=True,
 )
 def update_drowdown2(button, reset):
     changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
@@ -583,39 +829,49 @@ def update_drowdown2(button, reset):
         return get_start_conutries()
 
 
-@app.callback(
+@graph_callback(
     Output("graph3", "figure"),
     [
         Input("dropdown3", "value"),
         Input("window_selector2", "value"),
-        Input("country_dropdown", "value"),
+        Input("selection", "data"),
         Input("norm_dropdown3", "value"),
-        Input("button1", "n_clicks"),
-        Input("reset_button", "n_clicks"),
+        Input("data_version", "data"),
     ],
+    prevent_initial_call=True,
 )
 def update_figure3(
-    selected_cases, selected_window, selected_countries, selected_norm, button, reset,
+    selected_cases,
+    selected_window,
+    selected_countries,
+    selected_norm,
+    data_version,
 ):
-    changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
-    if "button1" in changed_id:
-        selected_countries = ["Sweden", "Denmark", "Finland", "Norway"]
-        selected_countries.sort()
-    elif "reset_button" in changed_id or (
-        reset == 0 and button == 0 and selected_countries == get_start_conutries()
-    ):
-        selected_countries = start_countries
-        selected_countries.sort()
+    dataset = data.current()
+    if dataset is None:
+        return message_figure(LOADING)
+    return figure3(
+        dataset,
+        tuple(sorted(selected_countries or [])),
+        selected_cases,
+        selected_window,
+        selected_norm,
+    )
 
-    if selected_cases == "confirmed cases":
-        df = df_conf_all[selected_countries]
-    elif selected_cases == "deaths":
-        df = df_deaths_all[selected_countries]
 
-    if selected_norm == "per capita":
-        df = per_capita_norm(df)
+@figure_cache.memoize
+def figure3(dataset, countries, selected_cases, selected_window, selected_norm):
+    countries = dataset.cube.select(countries)
+    total = countries.frame("total", selected_cases, selected_norm, selected_window)
+    new = countries.frame("new", selected_cases, selected_norm, selected_window)
 
-    traces, layout = new_vs_total(df, window=selected_window)
+    traces, layout = new_vs_total(
+        total,
+        new,
+        window=selected_window,
+        max_points=config.downsample_points("graph3"),
+        method=config.DOWNSAMPLE_METHOD,
+    )
 
     layout.update(
         dict(
@@ -633,10 +889,7 @@ def update_figure3(
         )
     )
     layout.update(extra_layout_vars)
-    return {
-        "data": traces,
-        "layout": layout,
-    }
+    return compact_figure({"data": traces, "layout": layout})
 
 
 @app.callback(
@@ -645,17 +898,34 @@ def update_figure3(
         Input("dropdown_sweden", "value"),
         Input("axis_dropdown_sweden", "value"),
         Input("window_selector_sweden", "value"),
+        Input("data_version", "data"),
     ],
+    prevent_initial_call=True,
 )
 def update_figure4(
-    selected_cases, selected_axis_type, selected_window,
+    selected_cases, selected_axis_type, selected_window, data_version,
 ):
-
-    df = sheet
+    dataset = data.current()
+    if dataset is None:
+        return message_figure(LOADING)
+    return figure4(dataset, selected_cases, selected_axis_type, selected_window)
+
+
+@figure_cache.memoize
+def figure4(dataset, selected_cases, selected_axis_type, selected_window):
+    if dataset.sheet.empty:
+        # The Swedish data failed to load, the other graphs still work
+        return message_figure("The Swedish data is currently unavailable")
+    max_points = config.downsample_points("graph_sweden")
+    method = config.DOWNSAMPLE_METHOD
     if selected_cases == "total":
-        traces, layout = landskap(df, total=True, window=selected_window)
+        traces, layout = region_traces(
+            dataset.regions, True, selected_window, max_points, method
+        )
     elif selected_cases == "new":
-        traces, layout = landskap(df, total=False, window=selected_window)
+        traces, layout = region_traces(
+            dataset.regions, False, selected_window, max_points, method
+        )
     else:
         print("Something went wrong")
 
@@ -677,10 +947,130 @@ def update_figure4(
         )
     )
     layout.update(extra_layout_vars)
-    return {
-        "data": traces,
-        "layout": layout,
-    }
+    figure = {"data": traces, "layout": layout}
+    return compact_figure(figure, daily_x=dataset.regions.daily)
+
+
+@app.callback(
+    Output("us_state_dropdown", "options"),
+    [Input("data_version", "data")],
+    prevent_initial_call=True,
+)
+def update_us_states(data_version):
+    return us_state_options(data.current())
+
+
+@app.callback(
+    Output("graph_us", "figure"),
+    [
+        Input("us_state_dropdown", "value"),
+        Input("us_cases_dropdown", "value"),
+        Input("us_kind_dropdown", "value"),
+        Input("us_norm_dropdown", "value"),
+        Input("us_window_selector", "value"),
+        Input("data_version", "data"),
+    ],
+    prevent_initial_call=True,
+)
+def update_figure_us(
+    selected_state,
+    selected_cases,
+    selected_kind,
+    selected_norm,
+    selected_window,
+    data_version,
+):
+    dataset = data.current()
+    if dataset is None:
+        return message_figure(LOADING)
+    return figure_us(
+        dataset,
+        selected_state,
+        selected_cases,
+        selected_kind,
+        selected_norm,
+        selected_window,
+    )
+
+
+@figure_cache.memoize
+def figure_us(
+    dataset,
+    selected_state,
+    selected_cases,
+    selected_kind,
+    selected_norm,
+    selected_window,
+):
+    us = dataset.us
+    if us is None:
+        # The US data failed to load or is disabled, the other graphs still work
+        return message_figure("The US data is currently unavailable")
+    if selected_state not in us.parents:
+        # Cleared, or a state missing from this data version
+        selected_state = None
+    df = us.series(
+        selected_cases,
+        selected_kind,
+        selected_window,
+        parent=selected_state,
+        per_capita=selected_norm == "per capita",
+    )
+
+    descr = "confirmed cases" if selected_cases == "confirmed" else "deaths"
+    title = "{} {} in {}, rolling mean of {} days".format(
+        selected_kind.capitalize(),
+        descr,
+        selected_state or "the US",
+        selected_window,
+    )
+    traces, layout = regions_vs_time(
+        df,
+        title,
+        dates=us.dates,
+        max_points=config.downsample_points("graph_us"),
+        method=config.DOWNSAMPLE_METHOD,
+    )
+
+    layout.update(
+        dict(
+            xaxis={"title": "Date", "gridcolor": gridcolor,},
+            yaxis={
+                "title": "{} {}".format(selected_kind.capitalize(), descr),
+                "gridcolor": gridcolor,
+            },
+        )
+    )
+    layout.update(extra_layout_vars)
+    return compact_figure({"data": traces, "layout": layout}, daily_x=us.daily)
+
+
+# Set last, Dash builds the layout right away and it needs the figure functions
+app.layout = serve_layout
+
+metrics.instrument(server, figure_cache)
+export.register(server, data.current)
+
+
+@server.route("/ready")
+def ready():
+    """Whether the data has been loaded, for health checks of a lazy start."""
+    dataset = data.current()
+    if dataset is None:
+        return flask.jsonify(ready=False), 503
+    return flask.jsonify(ready=True, version=dataset.version)
+
+
+@server.route("/cache-stats")
+def cache_stats():
+    """Hit and miss counters of the figure cache, as JSON."""
+    return flask.jsonify(figure_cache.stats())
+
+
+@server.route("/memory")
+def memory_report():
+    """Memory held by the data of the worker answering, as JSON."""
+    return flask.jsonify(memory.report(data.current()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+/* Client-side versions of the graph callbacks, see clientside.py, and the
+   country selection shared by the first three graphs, see app.py. */
+(function () {
+    function series(store, country, cases, norm) {
+        var entry = store.countries[country];
+        var values = cases === "deaths" ? entry.deaths : entry.confirmed;
+        if (norm !== "per capita") {
+            return values.slice();
+        }
+        // x100 as population is given in thousands, to get per 100 000
+        return values.map(function (v) {
+            return entry.population === null ? NaN : (v / entry.population) * 100;
+        });
+    }
+
+    function isMissing(v) {
+        return v === null || isNaN(v);
+    }
+
+    function diff(values) {
+        return values.map(function (v, ii) {
+            return ii === 0 ? NaN : v - values[ii - 1];
+        });
+    }
+
+    // Same as pandas rolling(window).mean(): missing until the window is full
+    // and whenever the window contains a missing value
+    function rolling(values, window) {
+        var out = [];
+        var sum = 0;
+        var missing = 0;
+        for (var ii = 0; ii < values.length; ii++) {
+            if (isMissing(values[ii])) {
+                missing++;
+            } else {
+                sum += values[ii];
+            }
+            if (ii >= window) {
+                if (isMissing(values[ii - window])) {
+                    missing--;
+                } else {
+                    sum -= values[ii - window];
+                }
+            }
+            out.push(ii >= window - 1 && missing === 0 ? sum / window : null);
+        }
+        return out;
+    }
+
+    function toJson(values) {
+        return values.map(function (v) {
+            return isMissing(v) ? null : v;
+        });
+    }
+
+    function selected(countries, store) {
+        return (countries || [])
+            .filter(function (country) {
+                return country in store.countries;
+            })
+            .sort();
+    }
+
+    function trace(country, x, y) {
+        return {
+            line: {width: 2},
+            mode: "lines+markers",
+            name: String(country),
+            x: x,
+            y: y,
+        };
+    }
+
+    function layout(store, title, xaxis, yaxis) {
+        var result = {
+            title: title,
+            autosize: true,
+            width: 800,
+            height: 600,
+            xaxis: Object.assign({gridcolor: store.style.gridcolor}, xaxis),
+            yaxis: Object.assign({gridcolor: store.style.gridcolor}, yaxis),
+        };
+        return Object.assign(result, store.style.extra_layout_vars);
+    }
+
+    function logRange(axis) {
+        // Avoid outliers dominating the plot on a log scale
+        return axis === "log" ? [0.001] : null;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        covid: {
+            // Sorted copy of the selected countries, the same selection is
+            // then one key for the server, see `selection` in app.py
+            selection: function (countries) {
+                var sorted = (countries || []).slice();
+                sorted.sort();
+                return sorted;
+            },
+
+            missing: function (countries, dataVersion, store) {
+                var missing = (countries || []).filter(function (country) {
+                    return !(country in store.countries);
+                });
+                // After a lazy start the store is filled once the data is loaded
+                var stale = dataVersion != null && store.version !== dataVersion;
+                if (missing.length === 0 && !stale) {
+                    return window.dash_clientside.no_update;
+                }
+                return {
+                    version: store.version,
+                    missing: missing,
+                    stored: Object.keys(store.countries),
+                };
+            },
+
+            total_vs_time: function (cases, axis, countries, norm, store) {
+                var traces = selected(countries, store).map(function (country) {
+                    var y = series(store, country, cases, norm);
+                    return trace(country, store.dates, toJson(y));
+                });
+                return {
+                    data: traces,
+                    layout: layout(
+                        store,
+                        "Total Covid-19 " + cases,
+                        {title: "Date"},
+                        {title: "Total " + cases, type: axis, range: logRange(axis)}
+                    ),
+                };
+            },
+
+            new_vs_time: function (cases, axis, norm, window, countries, store) {
+                var traces = selected(countries, store).map(function (country) {
+                    var y = rolling(diff(series(store, country, cases, norm)), window);
+                    return trace(country, store.dates.slice(39), y.slice(39));
+                });
+                return {
+                    data: traces,
+                    layout: layout(
+                        store,
+                        "New Covid-19 " + cases + " rolling mean of " + window + " days",
+                        {title: "Date"},
+                        {title: "New " + cases, type: axis, range: logRange(axis)}
+                    ),
+                };
+            },
+
+            new_vs_total: function (cases, window, countries, norm, store) {
+                var traces = selected(countries, store).map(function (country) {
+                    var total = series(store, country, cases, norm);
+                    return trace(
+                        country,
+                        rolling(total, window),
+                        rolling(diff(total), window)
+                    );
+                });
+                return {
+                    data: traces,
+                    layout: layout(
+                        store,
+                        "Rolling mean of " + window + " days",
+                        {title: "Total " + cases, type: "log"},
+                        {title: "New " + cases, type: "log", range: [0.001]}
+                    ),
+                };
+            },
+        },
+    });
+})();
@@ -0,0 +1 @@
+"""Offline benchmarks, run from the repository root as `python -m benchmarks.<name>`."""
@@ -0,0 +1,86 @@
+"""Memory held by the data of one worker, with and without compact types.
+
+Loads the synthetic sources in a fresh process per setting and prints the
+report of `memory.report` for both side by side, in MB. The snapshots are
+written by a first load, so the measured loads read them like a restarted
+worker does.
+
+    python -m benchmarks.memory [n_countries] [n_days]
+
+Writing the Swedish workbook needs openpyxl.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import synthetic
+
+
+def load_report(compact):
+    """Report of a fresh process loading the data, `compact` or not."""
+    env = dict(os.environ, COVID_COMPACT_DATA="1" if compact else "0")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.memory", "--child"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def _child():
+    import data
+    import memory
+
+    print(json.dumps(memory.report(data.load())))
+
+
+def _mb(n_bytes):
+    return "{:.2f}".format(n_bytes / 1e6)
+
+
+def main(n_countries=200, n_days=1000):
+    directory = tempfile.mkdtemp(prefix="covid-bench-")
+    try:
+        os.environ.update(synthetic.write_sources(directory, n_countries, n_days))
+        load_report(compact=False)
+        before = load_report(compact=False)
+        after = load_report(compact=True)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print("{} countries, {} days, sizes in MB".format(n_countries, n_days))
+    row = "{:16} {:>10} {:>10} {:>7}  {}"
+    print(row.format("", "before", "after", "ratio", "types after"))
+    for name, part in after["parts"].items():
+        old = before["parts"][name]["bytes"]
+        print(
+            row.format(
+                name,
+                _mb(old),
+                _mb(part["bytes"]),
+                "{:.2f}".format(part["bytes"] / old if old else 1),
+                part["dtype"] + (" mapped" if part["mapped"] else ""),
+            )
+        )
+    for total in ("private_bytes", "mapped_bytes", "resident_bytes"):
+        print(
+            row.format(
+                total.replace("_bytes", ""),
+                _mb(before[total]),
+                _mb(after[total]),
+                "{:.2f}".format(after[total] / before[total] if before[total] else 1),
+                "",
+            )
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        _child()
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,95 @@
+"""Payload size of each graph callback, with and without compact encoding.
+
+Sizes are in bytes of JSON, as sent by Dash, and of gzipped JSON, as sent when
+the server compresses responses, and build times in milliseconds. See
+`encoding` for what is compacted and `downsample` for how long traces are
+thinned out. Exits with an error if downsampling makes a payload larger.
+
+    python -m benchmarks.payload [n_countries] [n_days]
+"""
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+import plotly
+
+from benchmarks import synthetic
+
+
+def sizes(figure):
+    raw = json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder).encode()
+    return len(raw), len(gzip.compress(raw))
+
+
+def timed_build(build, args):
+    """Sizes of the figure `build(*args)` and the time to build it in ms."""
+    start = time.perf_counter()
+    figure = build(*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    return sizes(figure) + (elapsed,)
+
+
+def main(n_countries=200, n_days=1000):
+    with tempfile.TemporaryDirectory(prefix="covid-bench-") as directory:
+        os.environ.update(synthetic.write_sources(directory, n_countries, n_days))
+        _report(n_countries, n_days)
+
+
+def _report(n_countries, n_days):
+    import app
+    import config
+    import data
+
+    dataset = data.current()
+    countries = tuple(sorted(app.get_start_conutries()))
+    cases = "confirmed cases"
+    callbacks = [
+        ("graph1", app.figure1, (countries, cases, "linear", "per capita")),
+        ("graph2", app.figure2, (countries, cases, "linear", "per capita", 7)),
+        ("graph3", app.figure3, (countries, cases, 7, "total")),
+        ("graph4", app.figure4, ("new", "linear", 7)),
+    ]
+
+    print(
+        "{} countries, {} days, {} selected".format(n_countries, n_days, len(countries))
+    )
+    downsample = config.DOWNSAMPLE
+    row = "{:8}" + " {:>12}" * 6 + " {:>9}" * 3
+    header = ("json before", "compact", "downsampled")
+    print(row.format("", *header, "gzip before", *header[1:], "ms before", *header[1:]))
+    larger = []
+    for name, figure, args in callbacks:
+        # Call the builder directly, bypassing the figure cache
+        build = figure.__wrapped__
+        config.COMPACT_TRACES, config.DOWNSAMPLE = False, {}
+        json_before, gzip_before, ms_before = timed_build(build, (dataset, *args))
+        config.COMPACT_TRACES = True
+        json_compact, gzip_compact, ms_compact = timed_build(build, (dataset, *args))
+        config.DOWNSAMPLE = downsample
+        json_after, gzip_after, ms_after = timed_build(build, (dataset, *args))
+        print(
+            row.format(
+                name,
+                json_before,
+                json_compact,
+                json_after,
+                gzip_before,
+                gzip_compact,
+                gzip_after,
+                "{:.1f}".format(ms_before),
+                "{:.1f}".format(ms_compact),
+                "{:.1f}".format(ms_after),
+            )
+        )
+        if json_after > json_compact or gzip_after > gzip_compact:
+            larger.append(name)
+
+    if larger:
+        sys.exit("Downsampling made {} larger".format(", ".join(larger)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
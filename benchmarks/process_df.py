@@ -0,0 +1,80 @@
+"""Compare `utils.process_df` with the per-country loop it replaced.
+
+Checks that both give the same frame, also with missing values and countries
+of a single row, and prints the time each takes.
+
+    python -m benchmarks.process_df [n_regions] [n_days]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import jhu_frame
+from utils import parse_dates, process_df
+
+
+def process_df_loop(df):
+    """The original implementation of `utils.process_df`."""
+    df = df.copy()
+    df.pop("Province/State")
+    df.pop("Lat")
+    df.pop("Long")
+    data_dict = {}
+
+    for country in df.index.unique():
+        if len(df.loc[country].shape) > 1:
+            sum = df.loc[country].sum()
+        else:
+            sum = df.loc[country]
+        data_dict[country] = sum
+
+    return pd.DataFrame(data_dict)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def with_gaps(df, fraction=0.05, seed=0):
+    """`df` with a `fraction` of its counts missing, at random."""
+    df = df.copy()
+    counts = df.columns[3:]
+    values = df[counts].to_numpy(dtype=float)
+    values[np.random.default_rng(seed).random(values.shape) < fraction] = np.nan
+    df[counts] = values
+    return df
+
+
+def check(raw):
+    """Assert that `process_df` and the loop give the same frame for `raw`."""
+    new, t_new = timed(process_df, raw)
+    old, t_old = timed(process_df_loop, raw)
+    # process_df also parses the dates now
+    old.index = parse_dates(old.index)
+    pd.testing.assert_frame_equal(new, old)
+    return t_new, t_old
+
+
+def main(n_regions=10000, n_days=1000):
+    raw = jhu_frame(n_regions, n_days)
+    print("{} regions, {} days".format(n_regions, n_days))
+
+    # Missing values are skipped in sums, but kept for countries of one row.
+    # Half as many countries as regions gives many of those.
+    gaps = with_gaps(jhu_frame(n_regions, n_days // 10 + 2, n_regions // 2))
+    assert (gaps.index.value_counts() == 1).any()
+    check(gaps)
+
+    t_new, t_old = check(raw)
+
+    print("loop:       {:8.3f} s".format(t_old))
+    print("vectorized: {:8.3f} s".format(t_new))
+    print("speedup:    {:8.1f} x".format(t_old / t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,354 @@
+"""Timings of all stages of the app on synthetic data, saved as JSON.
+
+For each scale (countries x days) the synthetic sources are written to a
+temporary directory and timed in a fresh process:
+
+* ingestion: reading and parsing the CSV files, the WPP file, the Swedish
+  workbook and the US counties, and `data.load` with and without snapshots,
+* normalization: aligning the population and building the derived series,
+* figures: the builders in `my_dash_functions` and the figure functions of the
+  app, without the figure cache,
+* callbacks: the graph callbacks called through the Flask test client,
+  with an empty (cold) and a filled (warm) figure cache.
+
+No network access is needed. Compare the results of two commits with
+`--compare`::
+
+    python -m benchmarks.suite --output before.json
+    git checkout ...
+    python -m benchmarks.suite --output after.json --compare before.json
+
+Writing the Swedish workbook needs openpyxl.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import synthetic
+
+
+SCALES = ["50x200", "200x1000", "1000x1000"]
+
+
+def parse_scale(scale):
+    """Return `(n_countries, n_days)` of a scale written as e.g. '200x1000'."""
+    n_countries, n_days = scale.split("x")
+    return int(n_countries), int(n_days)
+
+
+def timed(func, repeat, setup=None):
+    """Time `repeat` calls of `func`, calling `setup` before each untimed."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return dict(
+        runs=repeat,
+        min=min(times),
+        median=statistics.median(times),
+        mean=statistics.mean(times),
+    )
+
+
+def _callback_body(output, inputs):
+    """Request body of a Dash callback, as sent by the browser."""
+    component, prop = output.split(".")
+    return {
+        "output": output,
+        "outputs": {"id": component, "property": prop},
+        "inputs": [
+            {"id": component_id, "property": name, "value": value}
+            for component_id, name, value in inputs
+        ],
+        "changedPropIds": [],
+        "state": [],
+    }
+
+
+def run_scale(n_countries, n_days, repeat):
+    """Time all stages at one scale, in the current process.
+
+    The app reads its configuration when imported, so this must run in a
+    process that has not imported it yet, see `main`.
+
+    Returns
+    -------
+    list
+        One dict per timing, with the stage, name and statistics in seconds.
+
+    """
+    directory = tempfile.mkdtemp(prefix="covid-bench-")
+    try:
+        os.environ.update(synthetic.write_sources(directory, n_countries, n_days))
+        return _run(repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _run(repeat):
+    import config
+    import data
+    import my_dash_functions
+    import utils
+    from cube import Cube
+    from population import align_population, load_population
+    from regions import parse_global
+
+    results = []
+
+    def record(stage, name, func, setup=None):
+        results.append(dict(stage=stage, name=name, **timed(func, repeat, setup)))
+
+    def clear_cache():
+        shutil.rmtree(config.CACHE_DIR, ignore_errors=True)
+
+    raw = utils.get_frame("confirmed")
+    record("ingestion", "get_frame", lambda: utils.get_frame("confirmed"))
+    record("ingestion", "process_df", lambda: utils.process_df(raw))
+    record("ingestion", "parse_global", lambda: parse_global(raw))
+    record("ingestion", "datetimeify", lambda: utils.datetimeify(raw.columns[3:]))
+    record(
+        "ingestion",
+        "load_population",
+        lambda: load_population(config.POPULATION_PATH),
+    )
+    record("ingestion", "load_sheet", data.load_sheet)
+    record("ingestion", "load_us", data.load_us, setup=clear_cache)
+    record("ingestion", "load_cold", data.load, setup=clear_cache)
+    data.load()
+    record("ingestion", "load_snapshot", data.load)
+
+    dataset = data.load()
+    provinces = {name: dataset.provinces.frame(name) for name in data.SERIES}
+    record(
+        "normalization",
+        "rollup",
+        lambda: data.region_store(provinces).rollup("confirmed"),
+    )
+    record(
+        "normalization",
+        "align_population",
+        lambda: align_population(dataset.wpp_population, dataset.countries),
+    )
+    record(
+        "normalization",
+        "cube",
+        lambda: Cube(dataset.confirmed, dataset.deaths, dataset.population),
+    )
+    record(
+        "normalization",
+        "dataset",
+        lambda: data.Dataset(
+            dataset.confirmed, dataset.deaths, dataset.sheet, dataset.wpp_population
+        ),
+    )
+
+    import app
+
+    data.swap(dataset)
+    countries = sorted(app.get_start_conutries())
+    cases = "confirmed cases"
+    total = dataset.cube.frame("total", cases, "per capita", 1, countries)
+    new = dataset.cube.frame("new", cases, "per capita", 7, countries)
+    regions = dataset.regions
+    builders = [
+        ("total_vs_time", lambda: my_dash_functions.total_vs_time(total, cases)),
+        ("new_vs_time", lambda: my_dash_functions.new_vs_time(new, cases, 7)),
+        ("new_vs_total", lambda: my_dash_functions.new_vs_total(total, new, 7)),
+        ("landskap", lambda: my_dash_functions.landskap(dataset.sheet, False, 7)),
+        ("region_traces", lambda: my_dash_functions.region_traces(regions, False, 7)),
+    ]
+    for name, build in builders:
+        record("figures", name, build)
+
+    key = tuple(countries)
+    figures = [
+        ("figure1", app.figure1, (key, cases, "linear", "per capita")),
+        ("figure2", app.figure2, (key, cases, "linear", "per capita", 7)),
+        ("figure3", app.figure3, (key, cases, 7, "total")),
+        ("figure4", app.figure4, ("new", "linear", 7)),
+        ("figure_us", app.figure_us, (None, "confirmed", "new", "per capita", 7)),
+    ]
+    record("figures", "selection", lambda: dataset.cube.select(key))
+    for name, figure, args in figures:
+        build = figure.__wrapped__
+        record("figures", name, lambda: build(dataset, *args))
+
+    client = app.server.test_client()
+    version = ("data_version", "data", dataset.version)
+    callbacks = [
+        (
+            "graph1.figure",
+            [
+                ("dropdown", "value", cases),
+                ("axis_dropdown", "value", "linear"),
+                ("selection", "data", countries),
+                ("norm_dropdown", "value", "per capita"),
+                version,
+            ],
+        ),
+        (
+            "graph2.figure",
+            [
+                ("dropdown2", "value", cases),
+                ("axis_dropdown2", "value", "linear"),
+                ("norm_dropdown2", "value", "per capita"),
+                ("window_selector", "value", 7),
+                ("selection", "data", countries),
+                version,
+            ],
+        ),
+        (
+            "graph3.figure",
+            [
+                ("dropdown3", "value", cases),
+                ("window_selector2", "value", 7),
+                ("selection", "data", countries),
+                ("norm_dropdown3", "value", "total"),
+                version,
+            ],
+        ),
+        (
+            "graph_sweden.figure",
+            [
+                ("dropdown_sweden", "value", "new"),
+                ("axis_dropdown_sweden", "value", "linear"),
+                ("window_selector_sweden", "value", 7),
+                version,
+            ],
+        ),
+        (
+            "graph_us.figure",
+            [
+                ("us_state_dropdown", "value", dataset.us.parents[0]),
+                ("us_cases_dropdown", "value", "confirmed"),
+                ("us_kind_dropdown", "value", "new"),
+                ("us_norm_dropdown", "value", "per capita"),
+                ("us_window_selector", "value", 7),
+                version,
+            ],
+        ),
+    ]
+    for output, inputs in callbacks:
+        body = _callback_body(output, inputs)
+
+        def call():
+            response = client.post("/_dash-update-component", json=body)
+            assert response.status_code == 200, response.status_code
+
+        name = output.split(".")[0]
+        record("callbacks", name + "_cold", call, setup=app.figure_cache.clear)
+        record("callbacks", name + "_warm", call)
+
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before, after):
+    """Print the ratio of the median times in `after` to those in `before`."""
+    medians = {
+        (r["scale"], r["stage"], r["name"]): r["median"] for r in before["results"]
+    }
+    row = "{:10} {:14} {:20} {:>10} {:>10} {:>7}"
+    print(row.format("scale", "stage", "name", "before", "after", "ratio"))
+    for r in after["results"]:
+        old = medians.get((r["scale"], r["stage"], r["name"]))
+        if old is None:
+            continue
+        print(
+            row.format(
+                r["scale"],
+                r["stage"],
+                r["name"],
+                "{:.4f}".format(old),
+                "{:.4f}".format(r["median"]),
+                "{:.2f}".format(r["median"] / old),
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", default=SCALES, help="e.g. 200x1000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="earlier results to compare with")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        # Run one scale and hand the results to the parent in a file
+        results = run_scale(*parse_scale(args.child), args.repeat)
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+        return
+
+    import numpy
+    import pandas
+
+    report = dict(
+        commit=_git_commit(),
+        created=datetime.now().isoformat(timespec="seconds"),
+        python=platform.python_version(),
+        numpy=numpy.__version__,
+        pandas=pandas.__version__,
+        repeat=args.repeat,
+        results=[],
+    )
+    for scale in args.scales:
+        n_countries, n_days = parse_scale(scale)
+        print("{} countries x {} days".format(n_countries, n_days), file=sys.stderr)
+        with tempfile.NamedTemporaryFile(suffix=".json") as child_output:
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.suite",
+                    "--child",
+                    scale,
+                    "--repeat",
+                    str(args.repeat),
+                    "--output",
+                    child_output.name,
+                ],
+                check=True,
+            )
+            results = json.load(child_output)
+        for result in results:
+            report["results"].append(
+                dict(scale=scale, n_countries=n_countries, n_days=n_days, **result)
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print("Results written to {}".format(args.output), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
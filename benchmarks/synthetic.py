@@ -0,0 +1,249 @@
+"""Synthetic data in the layout of the real data sources.
+
+Everything is generated from a seeded random generator, so the benchmarks run
+without network access and give comparable numbers between runs.
+"""
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from population import JHU_TO_WPP
+
+
+# Countries the app refers to by name, e.g. its default selections
+NAMED_COUNTRIES = [
+    "Sweden",
+    "France",
+    "Spain",
+    "Germany",
+    "Switzerland",
+    "US",
+    "Italy",
+    "United Kingdom",
+    "Denmark",
+    "Finland",
+    "Norway",
+]
+
+SWEDISH_REGIONS = [
+    "Blekinge",
+    "Dalarna",
+    "Gotland",
+    "Gävleborg",
+    "Halland",
+    "Jämtland_Härjedalen",
+    "Jönköping",
+    "Kalmar",
+    "Kronoberg",
+    "Norrbotten",
+    "Skåne",
+    "Stockholm",
+    "Sörmland",
+    "Uppsala",
+    "Värmland",
+    "Västerbotten",
+    "Västernorrland",
+    "Västmanland",
+    "Västra_Götaland",
+    "Örebro",
+    "Östergötland",
+]
+
+
+def date_labels(n_days, start=date(2020, 1, 22)):
+    """Date column labels in the JHU format, e.g. '1/22/20'."""
+    days = [start + timedelta(days=ii) for ii in range(n_days)]
+    return ["{}/{}/{:02d}".format(day.month, day.day, day.year % 100) for day in days]
+
+
+def country_names(n_countries):
+    extra = [
+        "Country {}".format(ii) for ii in range(n_countries - len(NAMED_COUNTRIES))
+    ]
+    return (NAMED_COUNTRIES + extra)[:n_countries]
+
+
+def jhu_frame(n_regions, n_days, n_countries=None, seed=0, counts_seed=None):
+    """Raw JHU global time series as returned by `utils.get_frame`.
+
+    Parameters
+    ----------
+    n_regions : int
+        Number of rows, i.e. countries and provinces.
+    n_days : int
+        Number of date columns.
+    n_countries : int
+        Number of distinct countries the regions belong to. Defaults to a
+        tenth of `n_regions`.
+    seed : int
+        Seed of the random generator.
+    counts_seed : int
+        Seed of the counts only, e.g. to get confirmed cases and deaths for
+        the same countries and provinces. Drawn with `seed` if None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Frame indexed by 'Country/Region' with 'Province/State', 'Lat', 'Long'
+        and one column of cumulative counts per date.
+
+    """
+    rng = np.random.default_rng(seed)
+    if n_countries is None:
+        n_countries = max(1, n_regions // 10)
+    names = country_names(n_countries)
+    # Every country gets at least one row, the rest are spread out randomly
+    owner = np.concatenate(
+        [np.arange(n_countries), rng.integers(0, n_countries, n_regions - n_countries)]
+    )
+    rng.shuffle(owner)
+
+    counts_rng = rng if counts_seed is None else np.random.default_rng(counts_seed)
+    counts = np.cumsum(counts_rng.poisson(20, size=(n_regions, n_days)), axis=1)
+    df = pd.DataFrame(counts, columns=date_labels(n_days))
+    df.insert(0, "Long", rng.uniform(-180, 180, n_regions))
+    df.insert(0, "Lat", rng.uniform(-90, 90, n_regions))
+    df.insert(0, "Country/Region", [names[ii] for ii in owner])
+    provinces = ["Province {}".format(ii) for ii in range(n_regions)]
+    df.insert(0, "Province/State", provinces)
+    return df.set_index("Country/Region")
+
+
+def jhu_csv(n_regions, n_days, n_countries=None, seed=0, counts_seed=None):
+    """Text of a JHU global time series CSV file, see `jhu_frame`."""
+    df = jhu_frame(n_regions, n_days, n_countries, seed, counts_seed).reset_index()
+    df.insert(0, "Province/State", df.pop("Province/State"))
+    return df.to_csv(index=False)
+
+
+def wpp_frame(countries, seed=0):
+    """WPP total population table covering the JHU `countries`."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for ii, country in enumerate(countries):
+        location = JHU_TO_WPP.get(country, country)
+        for year in (2019, 2020, 2021):
+            for variant in ("Medium", "High"):
+                pop_total = rng.uniform(300, 300000)
+                rows.append(
+                    dict(
+                        LocID=ii,
+                        Location=location,
+                        VarID=2,
+                        Variant=variant,
+                        Time=year,
+                        MidPeriod=year + 0.5,
+                        PopMale=pop_total / 2,
+                        PopFemale=pop_total / 2,
+                        PopTotal=pop_total,
+                        PopDensity=rng.uniform(1, 500),
+                    )
+                )
+    return pd.DataFrame(rows)
+
+
+def sweden_sheet(n_days, seed=0):
+    """Swedish regional new cases per day, as in the Folkhälsomyndigheten data."""
+    rng = np.random.default_rng(seed)
+    sheet = pd.DataFrame(
+        rng.poisson(30, size=(n_days, len(SWEDISH_REGIONS))), columns=SWEDISH_REGIONS
+    )
+    sheet.insert(0, "Statistikdatum", pd.date_range("2020-02-04", periods=n_days))
+    sheet["Totalt_antal_fall"] = sheet[SWEDISH_REGIONS].sum(axis=1)
+    return sheet
+
+
+def us_frame(
+    n_counties, n_days, n_states=50, seed=0, population=False, counts_seed=None
+):
+    """Raw JHU US time series by county, as in time_series_covid19_*_US.csv.
+
+    The counties are spread over `n_states` states and listed in random order,
+    and every state has an 'Unassigned' row without population. The deaths
+    file has a 'Population' column, pass `population=True` for it. The counts
+    are drawn with `counts_seed` if given, see `jhu_frame`.
+    """
+    rng = np.random.default_rng(seed)
+    n_states = min(n_states, n_counties)
+    owner = np.concatenate(
+        [np.arange(n_states), rng.integers(0, n_states, n_counties - n_states)]
+    )
+    rng.shuffle(owner)
+    counties = ["County {}".format(ii) for ii in range(n_counties)]
+    # The first row of each state is its 'Unassigned' row
+    first = np.unique(owner, return_index=True)[1]
+    for ii in first:
+        counties[ii] = "Unassigned"
+
+    counts_rng = rng if counts_seed is None else np.random.default_rng(counts_seed)
+    counts = np.cumsum(counts_rng.poisson(5, size=(n_counties, n_days)), axis=1)
+    df = pd.DataFrame(counts, columns=date_labels(n_days))
+    states = ["State {}".format(owner[ii]) for ii in range(n_counties)]
+    metadata = dict(
+        UID=84000000 + np.arange(n_counties),
+        iso2="US",
+        iso3="USA",
+        code3=840,
+        FIPS=np.arange(n_counties, dtype=float),
+        Admin2=counties,
+        Province_State=states,
+        Country_Region="US",
+        Lat=rng.uniform(20, 60, n_counties),
+        Long_=rng.uniform(-160, -60, n_counties),
+        Combined_Key=[
+            "{}, {}, US".format(county, state)
+            for county, state in zip(counties, states)
+        ],
+    )
+    if population:
+        sizes = rng.integers(1000, 1000000, n_counties)
+        sizes[first] = 0
+        metadata["Population"] = sizes
+    return pd.concat([pd.DataFrame(metadata), df], axis=1)
+
+
+def write_sources(directory, n_countries=200, n_days=1000, seed=0):
+    """Write all data sources of the app to `directory`.
+
+    Writing the Swedish workbook needs openpyxl.
+
+    Returns
+    -------
+    dict
+        Environment variables pointing the app to the written files.
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    n_regions = int(n_countries * 1.4)
+    # About as many US counties as in the real data for 200 countries
+    n_counties = n_countries * 16
+    # Both series list the same regions, only their counts differ
+    for ii, name in enumerate(("confirmed", "deaths")):
+        path = os.path.join(directory, "time_series_covid19_{}_global.csv".format(name))
+        with open(path, "w") as f:
+            f.write(jhu_csv(n_regions, n_days, n_countries, seed, seed + ii))
+        path = os.path.join(directory, "time_series_covid19_{}_US.csv".format(name))
+        df = us_frame(
+            n_counties,
+            n_days,
+            seed=seed,
+            population=name == "deaths",
+            counts_seed=seed + ii,
+        )
+        df.to_csv(path, index=False)
+
+    wpp_path = os.path.join(directory, "WPP2019_TotalPopulationBySex.csv")
+    wpp_frame(country_names(n_countries), seed).to_csv(wpp_path, index=False)
+
+    sweden_path = os.path.join(directory, "sweden.xlsx")
+    sweden_sheet(n_days, seed).to_excel(sweden_path, index=False)
+
+    return dict(
+        COVID_DATA_URL=directory,
+        COVID_POPULATION_PATH=wpp_path,
+        COVID_SWEDEN_URL=sweden_path,
+        COVID_CACHE_DIR=os.path.join(directory, "cache"),
+        COVID_REFRESH_INTERVAL="0",
+    )
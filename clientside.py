@@ -0,0 +1,144 @@
+"""Client-side mode, the first three graphs are computed in the browser.
+
+The cumulative counts of the selected countries are sent to the browser once
+and kept in a `dcc.Store`. Changing the axis type, the rolling mean window or
+the normalization is then handled by the JavaScript functions in
+assets/clientside.js without contacting the server. The server is only asked
+for the data of countries that have not been sent yet.
+
+Enabled with `COVID_CLIENTSIDE=1`.
+"""
+import dash
+import dash_core_components as dcc
+import numpy as np
+from dash.dependencies import ClientsideFunction, Input, Output, State
+
+
+def country_data(dataset, countries):
+    """The series the browser needs for each of `countries`."""
+    result = {}
+    for country in countries:
+        if country not in dataset.population.index:
+            continue
+        population = dataset.population[country]
+        result[country] = dict(
+            confirmed=dataset.confirmed[country].tolist(),
+            deaths=dataset.deaths[country].tolist(),
+            population=None if np.isnan(population) else population,
+        )
+    return result
+
+
+def store_data(dataset, countries, style):
+    """Full content of the store, holding the data of `countries`.
+
+    Empty if `dataset` is None, i.e. still loading. The browser then requests
+    the countries once the data version changes.
+    """
+    if dataset is None:
+        return dict(version=None, dates=[], style=style, countries={})
+    return dict(
+        version=dataset.version,
+        dates=dataset.dates,
+        style=style,
+        countries=country_data(dataset, countries),
+    )
+
+
+def components(dataset, countries, style):
+    """Layout components needed in client-side mode.
+
+    Parameters
+    ----------
+    dataset : data.Dataset
+        Data to embed for the initially selected `countries`, None if it is
+        still loading.
+    countries : list
+        Initially selected countries.
+    style : dict
+        Layout settings shared by all graphs, e.g. colors.
+
+    Returns
+    -------
+    list
+        Components to add to the layout.
+
+    """
+    return [
+        dcc.Store(id="country_store", data=store_data(dataset, countries, style)),
+        dcc.Store(id="country_request"),
+    ]
+
+
+def register(app, current, style):
+    """Register the client-side callbacks of the graphs on `app`.
+
+    Parameters
+    ----------
+    app : dash.Dash
+        The app.
+    current : callable
+        Returns the Dataset currently being served.
+    style : dict
+        Layout settings shared by all graphs, see `components`.
+
+    """
+    app.clientside_callback(
+        ClientsideFunction("covid", "missing"),
+        Output("country_request", "data"),
+        [Input("country_dropdown", "value"), Input("data_version", "data")],
+        [State("country_store", "data")],
+    )
+
+    @app.callback(
+        Output("country_store", "data"), [Input("country_request", "data")]
+    )
+    def send_countries(request):
+        if not request:
+            raise dash.exceptions.PreventUpdate
+        dataset = current()
+        if dataset is None:
+            raise dash.exceptions.PreventUpdate
+        if request["version"] != dataset.version:
+            # The data was refreshed, replace everything the browser holds
+            countries = request["stored"] + request["missing"]
+            return store_data(dataset, countries, style)
+        patch = dash.Patch()
+        for country, series in country_data(dataset, request["missing"]).items():
+            patch["countries"][country] = series
+        return patch
+
+    app.clientside_callback(
+        ClientsideFunction("covid", "total_vs_time"),
+        Output("graph1", "figure"),
+        [
+            Input("dropdown", "value"),
+            Input("axis_dropdown", "value"),
+            Input("country_dropdown", "value"),
+            Input("norm_dropdown", "value"),
+            Input("country_store", "data"),
+        ],
+    )
+    app.clientside_callback(
+        ClientsideFunction("covid", "new_vs_time"),
+        Output("graph2", "figure"),
+        [
+            Input("dropdown2", "value"),
+            Input("axis_dropdown2", "value"),
+            Input("norm_dropdown2", "value"),
+            Input("window_selector", "value"),
+            Input("country_dropdown", "value"),
+            Input("country_store", "data"),
+        ],
+    )
+    app.clientside_callback(
+        ClientsideFunction("covid", "new_vs_total"),
+        Output("graph3", "figure"),
+        [
+            Input("dropdown3", "value"),
+            Input("window_selector2", "value"),
+            Input("country_dropdown", "value"),
+            Input("norm_dropdown3", "value"),
+            Input("country_store", "data"),
+        ],
+    )
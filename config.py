@@ -0,0 +1,111 @@
+"""Runtime settings for the app, read from environment variables."""
+import os
+
+
+# Where the JHU time series CSVs are read from. Can be a URL or a local
+# directory holding files with the same names, e.g. for offline use.
+DATA_URL = os.environ.get(
+    "COVID_DATA_URL",
+    "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/"
+    "csse_covid_19_data/csse_covid_19_time_series",
+)
+
+# Checkout of the COVID-19 git submodule. With COVID_DATA_SOURCE=submodule the
+# time series are read from it, without network access. Files are only parsed
+# again when their content changes.
+SUBMODULE_DIR = os.environ.get("COVID_SUBMODULE_DIR", "COVID-19")
+if os.environ.get("COVID_DATA_SOURCE") == "submodule":
+    DATA_URL = os.path.join(
+        SUBMODULE_DIR, "csse_covid_19_data", "csse_covid_19_time_series"
+    )
+
+# Swedish regional data from Folkhälsomyndigheten, an Excel workbook
+SWEDEN_URL = os.environ.get(
+    "COVID_SWEDEN_URL",
+    "https://www.arcgis.com/sharing/rest/content/items/"
+    "b5e7488e117749c19881cce45db13f7e/data",
+)
+
+# Also load the JHU US time series per county, for the US graph
+US_DATA = os.environ.get("COVID_US_DATA", "1") not in ("", "0")
+
+# UN World Population Prospects 2019 total population per country
+POPULATION_PATH = os.environ.get(
+    "COVID_POPULATION_PATH", "external/WPP2019_TotalPopulationBySex.csv"
+)
+
+# Timeout in seconds for each download
+FETCH_TIMEOUT = float(os.environ.get("COVID_FETCH_TIMEOUT", 60))
+
+# Timeouts per source, e.g. COVID_FETCH_TIMEOUT_SWEDEN=20, defaulting to the above
+FETCH_TIMEOUTS = {
+    source: float(
+        os.environ.get("COVID_FETCH_TIMEOUT_{}".format(source.upper()), FETCH_TIMEOUT)
+    )
+    for source in ("confirmed", "deaths", "sweden", "us")
+}
+
+# Number of retries of a failed download
+FETCH_RETRIES = int(os.environ.get("COVID_FETCH_RETRIES", 3))
+
+# Directory for on-disk snapshots of processed data
+CACHE_DIR = os.environ.get("COVID_CACHE_DIR", ".cache")
+
+# Age in seconds after which a snapshot is refreshed from `DATA_URL`
+CACHE_TTL = float(os.environ.get("COVID_CACHE_TTL", 6 * 3600))
+
+# Seconds between checks of the sources for new data, 0 disables refreshing
+REFRESH_INTERVAL = float(os.environ.get("COVID_REFRESH_INTERVAL", 3600))
+
+# Number of figures kept in the LRU cache of each worker, 0 disables it
+FIGURE_CACHE_SIZE = int(os.environ.get("COVID_FIGURE_CACHE_SIZE", 256))
+
+# Serve the app right away and load the data in the background, see /ready
+LAZY_START = os.environ.get("COVID_LAZY_START", "") not in ("", "0")
+
+# Directory through which all workers share one memory-mapped copy of the
+# data, see shared.py. Each worker loads its own copy if empty.
+SHARED_DIR = os.environ.get("COVID_SHARED_DIR", "")
+
+# Compute the first three graphs in the browser, see clientside.py
+CLIENTSIDE = os.environ.get("COVID_CLIENTSIDE", "") not in ("", "0")
+
+# Round trace values to float32 precision and send daily date axes as start
+# and step, see encoding.py
+COMPACT_TRACES = os.environ.get("COVID_COMPACT_TRACES", "1") not in ("", "0")
+
+# Hold the data in smaller types: counts as int32 where they are whole numbers
+# and the derived series as float32, see memory.py for the savings
+COMPACT_DATA = os.environ.get("COVID_COMPACT_DATA", "") not in ("", "0")
+
+# Send trace values as base64 typed arrays, needs plotly.js 2.28 or later
+TYPED_ARRAYS = os.environ.get("COVID_TYPED_ARRAYS", "") not in ("", "0")
+
+
+def _downsample_points(value):
+    """Parse e.g. "800" or "800,graph3=400,graph_sweden=0" into points per graph."""
+    points = {}
+    for part in value.split(","):
+        if "=" in part:
+            graph, n_points = part.split("=")
+            points[graph.strip()] = int(n_points)
+        elif part.strip():
+            points["default"] = int(part)
+    return points
+
+
+# Maximum number of points per trace, about the width of the graphs in pixels.
+# A single number applies to all graphs, 0 turns downsampling off. Traces up to
+# twice as long are sent whole, see downsample.py. The Swedish and US graphs
+# have many traces and are smaller sent as compact daily traces by default.
+DOWNSAMPLE = _downsample_points(
+    os.environ.get("COVID_DOWNSAMPLE", "800,graph_sweden=0,graph_us=0")
+)
+
+# 'lttb' or 'minmax', see downsample.py
+DOWNSAMPLE_METHOD = os.environ.get("COVID_DOWNSAMPLE_METHOD", "minmax")
+
+
+def downsample_points(graph):
+    """Maximum number of points per trace of `graph`, 0 for no limit."""
+    return DOWNSAMPLE.get(graph, DOWNSAMPLE.get("default", 0))
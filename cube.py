@@ -0,0 +1,278 @@
+"""Derived series for all countries, computed once per Dataset.
+
+The graphs show cumulative counts, new counts per day and rolling means of
+both, optionally per 100,000 inhabitants. Instead of computing these for the
+selected countries in every callback, all of them are computed for all
+countries at once when the data is loaded and stored in one dense array. The
+callbacks then only pick out the columns of the selected countries.
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from encoding import is_daily
+from utils import iso_dates
+
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("total", "new")
+METRICS = ("confirmed cases", "deaths")
+NORMS = ("total", "per capita")
+
+
+class Cube:
+    """Dense array of all derived series.
+
+    The array is indexed by (kind, metric, normalization, window, date,
+    country), where kind is one of `KINDS`, metric one of `METRICS`,
+    normalization one of `NORMS` and window the length of the rolling mean
+    in days minus one, so window 0 holds the plain series.
+
+    Parameters
+    ----------
+    confirmed : pandas.DataFrame
+        Cumulative confirmed cases, dates as index and countries as columns.
+    deaths : pandas.DataFrame
+        Cumulative deaths, same layout as `confirmed`.
+    population : pandas.Series
+        Population in thousands, indexed like the columns of `confirmed`.
+    windows : int
+        Number of rolling mean windows, 1 up to and including `windows`.
+    dtype : numpy.dtype
+        Data type of the array.
+
+    """
+
+    # Number of selections whose columns are kept, see `select`
+    SELECTIONS = 64
+
+    def __init__(self, confirmed, deaths, population, windows=14, dtype=np.float64):
+        self.index = confirmed.index
+        self.columns = confirmed.columns
+        self.windows = windows
+        self._positions = pd.Series(np.arange(len(self.columns)), index=self.columns)
+        self._selections = {}
+        self._lock = threading.Lock()
+
+        shape = (
+            len(KINDS),
+            len(METRICS),
+            len(NORMS),
+            windows,
+            len(self.index),
+            len(self.columns),
+        )
+        self.values = np.empty(shape, dtype=dtype)
+        # x100 as population is given in thousands, to get per 100 000
+        per_capita = 100 / population[self.columns].to_numpy()
+
+        for mm, df in enumerate((confirmed, deaths)):
+            values = df.to_numpy(dtype=float)
+            for nn, norm in enumerate(NORMS):
+                normed = values * per_capita if norm == "per capita" else values
+                new = np.full_like(normed, np.nan)
+                new[1:] = np.diff(normed, axis=0)
+                for kk, series in enumerate((normed, new)):
+                    rolling_means(series, windows, out=self.values[kk, mm, nn])
+
+        logger.info("Derived-metric cube: %s", self.memory_usage())
+
+    @classmethod
+    def from_array(cls, values, index, columns):
+        """Wrap an array computed earlier, e.g. memory-mapped from disk."""
+        cube = cls.__new__(cls)
+        cube.index = index
+        cube.columns = columns
+        cube.windows = values.shape[3]
+        cube._positions = pd.Series(np.arange(len(columns)), index=columns)
+        cube._selections = {}
+        cube._lock = threading.Lock()
+        cube.values = values
+        return cube
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def memory_usage(self):
+        """Human readable shape and size of the array."""
+        return "shape {}, {} ({:.1f} MB)".format(
+            self.values.shape, self.values.dtype, self.nbytes / 1e6
+        )
+
+    def frame(self, kind, metric, norm, window, countries):
+        """Return one derived series for `countries`.
+
+        Parameters
+        ----------
+        kind : string
+            'total' for cumulative counts, 'new' for new counts per day.
+        metric : string
+            'confirmed cases' or 'deaths'.
+        norm : string
+            'total' or 'per capita', the latter is per 100,000 inhabitants.
+        window : int
+            Length of the rolling mean in days, 1 for none.
+        countries : list
+            Country names, the columns of the returned frame.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dates as index and `countries` as columns.
+
+        """
+        cols = self._positions[countries].to_numpy()
+        block = self._block(kind, metric, norm, window)
+        return pd.DataFrame(block[:, cols], index=self.index, columns=countries)
+
+    def _block(self, kind, metric, norm, window):
+        return self.values[
+            KINDS.index(kind), METRICS.index(metric), NORMS.index(norm), window - 1
+        ]
+
+    def select(self, countries):
+        """Return a `Selection` of `countries`, see there.
+
+        The columns of the last `SELECTIONS` selections are kept, so the
+        graphs showing the same countries look them up only once.
+        """
+        key = tuple(countries)
+        with self._lock:
+            cols = self._selections.get(key)
+            if cols is None:
+                cols = self._positions[list(key)].to_numpy()
+                if len(self._selections) >= self.SELECTIONS:
+                    # The oldest, dicts keep the order of insertion
+                    del self._selections[next(iter(self._selections))]
+                self._selections[key] = cols
+        return Selection(self, key, cols)
+
+
+class Selection:
+    """Derived series of one set of countries, shared by the graphs showing it.
+
+    Holds the columns of the countries in the cube, the frames are sliced out
+    of the cube when asked for.
+
+    Parameters
+    ----------
+    cube : Cube
+        Series of all countries.
+    countries : list
+        Country names, the columns of the frames.
+    cols : numpy.ndarray
+        Columns of `countries` in the cube, looked up if None.
+
+    """
+
+    def __init__(self, cube, countries, cols=None):
+        self.cube = cube
+        self.countries = list(countries)
+        if cols is None:
+            cols = cube._positions[self.countries].to_numpy()
+        self._cols = cols
+
+    def frame(self, kind, metric, norm, window):
+        """Return one derived series of the countries, see `Cube.frame`."""
+        block = self.cube._block(kind, metric, norm, window)
+        return pd.DataFrame(
+            block[:, self._cols], index=self.cube.index, columns=self.countries
+        )
+
+
+class RegionViews:
+    """Derived series of the Swedish regions, for the Sweden graph.
+
+    Holds the new cases per day and their cumulative sum, with rolling means,
+    in an array indexed by (kind, window, date, region) like `Cube`. The
+    regions are ordered by the number of cases on the second to last day, the
+    last one often being incomplete, and `visible` holds whether each region is
+    shown initially or only listed in the legend.
+
+    Parameters
+    ----------
+    sheet : pandas.DataFrame
+        Swedish regional data, 'Statistikdatum' and one column per region.
+    windows : int
+        Number of rolling mean windows, 1 up to and including `windows`.
+    dtype : numpy.dtype
+        Data type of the array.
+
+    """
+
+    # Shown in addition to the four regions with the most cases
+    ALWAYS_VISIBLE = ("Skåne",)
+
+    def __init__(self, sheet, windows=14, dtype=np.float64):
+        self.windows = windows
+        df = sheet.drop(columns="Statistikdatum")
+        dates = pd.DatetimeIndex(sheet["Statistikdatum"])
+        self.dates = iso_dates(dates)
+        self.daily = is_daily(dates)
+        if len(df) >= 2:
+            df = df[df.iloc[len(df) - 2].sort_values(ascending=False).index]
+        self.regions = [str(region) for region in df.columns]
+        self.visible = [
+            True if ii < 4 or region in self.ALWAYS_VISIBLE else "legendonly"
+            for ii, region in enumerate(self.regions)
+        ]
+
+        new = df.to_numpy(dtype=float)
+        # Like DataFrame.cumsum, missing days stay missing but do not stop the sum
+        total = np.cumsum(np.nan_to_num(new), axis=0)
+        total[np.isnan(new)] = np.nan
+        self.values = np.empty((len(KINDS), windows) + new.shape, dtype=dtype)
+        for kk, series in enumerate((total, new)):
+            rolling_means(series, windows, out=self.values[kk])
+
+    def series(self, kind, window):
+        """Array of the rolling means of `kind` over `window` days, by region.
+
+        Windows longer than `windows` are computed on the fly.
+        """
+        kk = KINDS.index(kind)
+        if window <= self.windows:
+            return self.values[kk, window - 1]
+        return rolling_means(self.values[kk, 0], window)[-1]
+
+
+def rolling_means(values, windows, out=None):
+    """Rolling means of `values` over 1 up to `windows` rows.
+
+    Same result as `DataFrame.rolling(window).mean()` for every window, but
+    computed for all of them from a single cumulative sum.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        2D array, dates along the first axis.
+    windows : int
+        Largest window.
+    out : numpy.ndarray
+        Array of shape `(windows,) + values.shape` to write the result to.
+
+    Returns
+    -------
+    numpy.ndarray
+        The rolling means, window `ww + 1` at index `ww`.
+
+    """
+    if out is None:
+        out = np.empty((windows,) + values.shape)
+    missing = np.isnan(values)
+    zero = np.zeros((1, values.shape[1]))
+    sums = np.concatenate([zero, np.cumsum(np.where(missing, 0, values), axis=0)])
+    n_missing = np.concatenate([zero, np.cumsum(missing, axis=0)])
+
+    for ww in range(windows):
+        window = ww + 1
+        out[ww, :ww] = np.nan
+        mean = (sums[window:] - sums[:-window]) / window
+        # Like pandas, a window with any missing value gives a missing mean
+        mean[n_missing[window:] - n_missing[:-window] > 0] = np.nan
+        out[ww, ww:] = mean
+    return out
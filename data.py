@@ -0,0 +1,665 @@
+"""The data served by the app and the background refresher that updates it.
+
+All data the callbacks read is bundled in a `Dataset`. A Dataset is never
+modified after it has been published, a refresh builds a new one and swaps it
+in with a single assignment. Callbacks should call `current()` once and read
+everything from the returned Dataset, that way they never mix old and new data.
+"""
+import csv
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import config
+import excel
+import snapshot
+from cube import Cube, RegionViews
+from encoding import is_daily
+from fetch import fetch, file_fingerprint, is_local
+from population import align_population, load_population
+from regions import RegionStore, compact, parse_global, parse_us, region_rows
+from regions import us_population
+from search import ALIASES, SearchIndex
+from utils import get_frame, iso_dates, parse_dates, series_url, us_series_url
+
+
+logger = logging.getLogger(__name__)
+
+SERIES = ("confirmed", "deaths")
+
+
+class Dataset:
+    """Snapshot of all data used by the app.
+
+    Parameters
+    ----------
+    confirmed : pandas.DataFrame
+        Confirmed cases, a DatetimeIndex as index and countries as columns.
+    deaths : pandas.DataFrame
+        Deaths, same layout as `confirmed`. Reindexed to the dates and
+        countries of `confirmed` if they differ.
+    sheet : pandas.DataFrame
+        Swedish regional data as published by Folkhälsomyndigheten.
+    wpp_population : pandas.Series
+        Population in thousands by WPP location, see
+        `population.load_population`.
+    cube : cube.Cube
+        Derived series computed earlier for the same data, built from the
+        frames if None.
+    version : string
+        Version computed earlier for the same data, computed from the frames
+        if None.
+    us : regions.RegionStore
+        US confirmed cases and deaths by state and county, None if not loaded.
+    provinces : regions.RegionStore
+        Confirmed cases and deaths by country and province, `confirmed` and
+        `deaths` are its roll-ups to countries. None if not loaded.
+
+    """
+
+    def __init__(
+        self,
+        confirmed,
+        deaths,
+        sheet,
+        wpp_population,
+        cube=None,
+        version=None,
+        us=None,
+        provinces=None,
+    ):
+        if not (
+            deaths.index.equals(confirmed.index)
+            and deaths.columns.equals(confirmed.columns)
+        ):
+            deaths = deaths.reindex(index=confirmed.index, columns=confirmed.columns)
+        if config.COMPACT_DATA:
+            # Counts as int32, and the derived series below as float32
+            confirmed, deaths = _compact_frame(confirmed), _compact_frame(deaths)
+        self.confirmed = confirmed
+        self.deaths = deaths
+        self.sheet = sheet
+        self.wpp_population = wpp_population
+        self.countries = list(confirmed.keys())
+        # Population in thousands, aligned with the columns
+        self.population = align_population(wpp_population, self.countries)
+        # Dates as ISO strings, ready to be sent to the graphs
+        self.dates = iso_dates(confirmed.index)
+        self.daily = is_daily(confirmed.index)
+        # Cumulative, new and rolling mean series of all countries
+        dtype = np.float32 if config.COMPACT_DATA else np.float64
+        if cube is None:
+            cube = Cube(confirmed, deaths, self.population, dtype=dtype)
+        self.cube = cube
+        # Series of the Swedish regions for the Sweden graph
+        self.regions = RegionViews(sheet, dtype=dtype)
+        self.country_search = SearchIndex(
+            [{"label": country, "value": country} for country in self.countries],
+            ALIASES,
+        )
+        self.country_options = self.country_search.options
+        # US states and counties for the US graph
+        self.us = us
+        # Countries and their provinces, the countries summed up once
+        self.provinces = provinces
+        if version is None:
+            regions = [store for store in (provinces, us) if store is not None]
+            frames = [store.frame(name) for store in regions for name in store.metrics]
+            version = _content_hash(confirmed, deaths, sheet, *frames)
+        self.version = version
+
+
+def _compact_frame(df):
+    """`df` as int32 if all its values are whole numbers that fit, else as is."""
+    if (df.dtypes == np.int32).all():
+        return df
+    values = compact(df.to_numpy())
+    if values.dtype != np.int32:
+        return df
+    return pd.DataFrame(values, index=df.index, columns=df.columns, copy=False)
+
+
+def _same_frame(df, other):
+    """Whether `df` and `other` have the same labels and values."""
+    return (
+        df.index.equals(other.index)
+        and df.columns.equals(other.columns)
+        and np.array_equal(
+            df.to_numpy(dtype=float), other.to_numpy(dtype=float), equal_nan=True
+        )
+    )
+
+
+def _content_hash(*frames):
+    sha = hashlib.sha1()
+    for df in frames:
+        sha.update(",".join(str(col) for col in df.columns).encode())
+        sha.update(np.ascontiguousarray(df.to_numpy(dtype=float)).tobytes())
+    return sha.hexdigest()[:12]
+
+
+def load_sheet():
+    """Download and parse the Swedish regional data."""
+    content, _ = fetch(config.SWEDEN_URL, timeout=config.FETCH_TIMEOUTS["sweden"])
+    return parse_sheet(content)
+
+
+def parse_sheet(content):
+    """Parse the Swedish workbook `content`, cached by its hash."""
+    return excel.cached_sheet(
+        content, config.CACHE_DIR, "sweden", index="Statistikdatum"
+    )
+
+
+def empty_sheet():
+    """Swedish regional data without any dates, used when it can not be loaded."""
+    return pd.DataFrame({"Statistikdatum": pd.DatetimeIndex([])})
+
+
+def _snapshot_key(url, etag=None):
+    """Source key of snapshots parsed from `url`, see `snapshot.cached`.
+
+    The git blob hash of a local file, which `fetch` also returns as `etag`,
+    and None for a URL.
+    """
+    if not is_local(url):
+        return None
+    return file_fingerprint(url) if etag is None else etag
+
+
+def _write_snapshot(df, name, url, etag):
+    """Write the snapshot `name` of `df` parsed from `url`, keyed like `cached`."""
+    try:
+        snapshot.write_snapshot(
+            df, config.CACHE_DIR, name, source_key=_snapshot_key(url, etag)
+        )
+    except OSError:
+        logger.warning("Could not write snapshot %s", name)
+
+
+def load_provinces(name):
+    """Return the JHU global time series `name` by country and province.
+
+    The parsed frame goes through a snapshot named e.g. 'provinces_confirmed',
+    see `snapshot.cached`. A local source is only parsed again when its
+    content changes, others when the snapshot is older than
+    `config.CACHE_TTL`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Frame as returned by `regions.parse_global`.
+
+    """
+    return snapshot.cached(
+        "provinces_" + name,
+        lambda: parse_global(get_frame(name)),
+        config.CACHE_DIR,
+        config.CACHE_TTL,
+        source_key=_snapshot_key(series_url(name)),
+    )
+
+
+def load_us():
+    """Return the JHU US data by county, see `regions.RegionStore`.
+
+    Like the global series, the parsed frames go through snapshots, see
+    `load_provinces`. The population is taken from the deaths file, which is
+    read at most once.
+    """
+    raw = {}
+
+    def read(name):
+        if name not in raw:
+            content, _ = fetch(us_series_url(name), timeout=config.FETCH_TIMEOUTS["us"])
+            raw[name] = pd.read_csv(io.BytesIO(content))
+        return raw[name]
+
+    def cached(snapshot_name, name, loader):
+        return snapshot.cached(
+            snapshot_name,
+            loader,
+            config.CACHE_DIR,
+            config.CACHE_TTL,
+            source_key=_snapshot_key(us_series_url(name)),
+        )
+
+    frames = {
+        name: cached("us_" + name, name, lambda name=name: parse_us(read(name)))
+        for name in SERIES
+    }
+    population = cached(
+        "us_population", "deaths", lambda: us_population(read("deaths"))
+    )
+    return region_store(frames, population, "US")
+
+
+def region_store(frames, population=None, description="Region"):
+    """Build a store from frames as returned by e.g. `parse_us`.
+
+    The deaths are aligned to the regions and dates of the confirmed cases.
+    """
+    confirmed = frames["confirmed"]
+    aligned = {}
+    for name, df in frames.items():
+        if not (
+            df.index.equals(confirmed.index) and df.columns.equals(confirmed.columns)
+        ):
+            df = df.reindex(index=confirmed.index, columns=confirmed.columns)
+        aligned[name] = df
+    if population is not None:
+        population = population.reindex(columns=confirmed.columns)
+    store = RegionStore.from_frames(aligned, population)
+    logger.info("%s data: %s", description, store.memory_usage())
+    return store
+
+
+def load():
+    """Build a Dataset from the snapshots, or the sources if they are stale.
+
+    The sources are fetched and parsed concurrently. The Swedish and US data
+    are optional, if they fail to load the Dataset holds an empty sheet and no
+    US data, and the refresher tries again later.
+    """
+    with ThreadPoolExecutor(max_workers=5, thread_name_prefix="load") as pool:
+        provinces = {name: pool.submit(load_provinces, name) for name in SERIES}
+        sheet = pool.submit(load_sheet)
+        population = pool.submit(load_population, config.POPULATION_PATH)
+        us = pool.submit(load_us) if config.US_DATA else None
+
+        try:
+            sheet = sheet.result()
+        except Exception:
+            logger.exception("Loading the Swedish data failed, continuing without")
+            sheet = empty_sheet()
+        if us is not None:
+            try:
+                us = us.result()
+            except Exception:
+                logger.exception("Loading the US data failed, continuing without")
+                us = None
+        # The country series are the roll-ups of the provinces
+        provinces = region_store(
+            {name: future.result() for name, future in provinces.items()},
+            description="Global",
+        )
+        return Dataset(
+            provinces.rollup("confirmed"),
+            provinces.rollup("deaths"),
+            sheet,
+            population.result(),
+            us=us,
+            provinces=provinces,
+        )
+
+
+def load_or_attach():
+    """Return the Dataset to serve at start-up.
+
+    In shared mode, see `shared`, the published data is attached to, and
+    published first if there is none yet. Only one worker publishes it, the
+    others wait for it and then attach. Otherwise the data is loaded by this
+    process.
+    """
+    if not config.SHARED_DIR:
+        return load()
+
+    import shared
+
+    dataset = shared.attach(config.SHARED_DIR)
+    if dataset is None:
+        with shared.lock(config.SHARED_DIR):
+            dataset = shared.attach(config.SHARED_DIR)
+            if dataset is None:
+                dataset = shared.build(config.SHARED_DIR)
+    return dataset
+
+
+def _to_float(fields):
+    block = np.array(fields, dtype=str)
+    block[block == ""] = "nan"
+    return block.astype(float)
+
+
+class IncrementalSeries:
+    """Keeps a JHU global time series up to date with minimal parsing.
+
+    The raw rows of the last parsed CSV are remembered together with a hash of
+    their values. On update, only the values of new date columns are parsed
+    for every row. Rows whose existing values changed, i.e. retroactive
+    revisions, are parsed in full. The result is the series by country and
+    province, as `regions.parse_global` returns it, the countries are summed
+    up by the `regions.RegionStore` built from it.
+
+    All countries are summed up again on every update, not only those with
+    revised rows. The roll-up is one vectorized pass over the block, which
+    costs about as much as copying the unchanged countries would.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.etag = None
+        self.dates = []
+        self.keys = []  # (province, country, occurrence) of each raw row
+        self.hashes = {}  # key -> hash of the raw values
+        self.raw = np.empty((0, 0))
+        self.frame = None
+
+    def update(self, text):
+        """Apply the CSV `text` and return the new frame by province.
+
+        Returns None if nothing changed.
+        """
+        reader = csv.reader(io.StringIO(text))
+        header = next(reader)
+        rows = [row for row in reader if row]
+        dates = header[4:]
+        n_old = len(self.dates)
+
+        if dates[:n_old] != self.dates or self.frame is None:
+            # First run, or the history was reshuffled: start over
+            self.__init__(self.name)
+            n_old = 0
+
+        # Rows repeating a province are told apart by their occurrence
+        seen = {}
+        keys = []
+        for row in rows:
+            key = (row[0], row[1])
+            seen[key] = seen.get(key, -1) + 1
+            keys.append(key + (seen[key],))
+        hashes = {
+            key: hash(tuple(row[4 : 4 + n_old])) for key, row in zip(keys, rows)
+        }
+        revised = [
+            ii for ii, key in enumerate(keys) if self.hashes.get(key) != hashes[key]
+        ]
+        removed = set(self.keys) - set(keys)
+        n_new = len(dates) - n_old
+        if not revised and not removed and n_new == 0:
+            return None
+
+        # Reuse the parsed values of unchanged rows, parse the new dates only
+        old_pos = {key: ii for ii, key in enumerate(self.keys)}
+        raw = np.empty((len(rows), len(dates)))
+        for ii, key in enumerate(keys):
+            if key in old_pos:
+                raw[ii, :n_old] = self.raw[old_pos[key]]
+        if revised:
+            raw[revised, :n_old] = _to_float(
+                [rows[ii][4 : 4 + n_old] for ii in revised]
+            )
+        if n_new:
+            raw[:, n_old:] = _to_float([row[4 + n_old :] for row in rows])
+
+        labels, values = region_rows(
+            raw, [key[1] for key in keys], [key[0] or None for key in keys]
+        )
+        self.frame = pd.DataFrame(
+            compact(values.T), index=parse_dates(dates), columns=labels
+        )
+        self.dates = dates
+        self.keys = keys
+        self.hashes = {key: hash(tuple(row[4:])) for key, row in zip(keys, rows)}
+        self.raw = raw
+        return self.frame
+
+
+class Refresher(threading.Thread):
+    """Background thread periodically refreshing the current Dataset."""
+
+    def __init__(self, interval):
+        super().__init__(name="data-refresher", daemon=True)
+        self.interval = interval
+        self.series = {name: IncrementalSeries(name) for name in SERIES}
+        self.sheet_etag = None
+        self.us_etags = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Refreshing data failed")
+
+    def refresh(self):
+        """Check all sources once and publish a new Dataset if any changed."""
+        old = current()
+        frames = {}
+        changed = False
+        for name, series in self.series.items():
+            content, etag = fetch(
+                series_url(name), series.etag, config.FETCH_TIMEOUTS[name]
+            )
+            if content is None:
+                continue
+            frame = series.update(content.decode("utf-8"))
+            series.etag = etag
+            if frame is None or (
+                old.provinces is not None
+                and _same_frame(frame, old.provinces.frame(name))
+            ):
+                # The first refresh parses the whole file to seed the
+                # incremental state, usually finding the data already loaded
+                continue
+            frames[name] = frame
+            changed = True
+            _write_snapshot(frame, "provinces_" + name, series_url(name), etag)
+
+        provinces = old.provinces
+        if frames:
+            for name in SERIES:
+                if name in frames:
+                    continue
+                if provinces is not None:
+                    frames[name] = provinces.frame(name)
+                else:
+                    frames[name] = load_provinces(name)
+            provinces = region_store(frames, description="Global")
+
+        sheet = old.sheet
+        try:
+            content, etag = fetch(
+                config.SWEDEN_URL, self.sheet_etag, config.FETCH_TIMEOUTS["sweden"]
+            )
+        except Exception:
+            # Optional source, keep the countries up to date without it
+            logger.exception("Fetching the Swedish data failed")
+            content = None
+        if content is not None:
+            sheet = parse_sheet(content)
+            self.sheet_etag = etag
+            changed = changed or not sheet.equals(old.sheet)
+
+        us = old.us
+        if config.US_DATA:
+            try:
+                us = self.refresh_us(old.us)
+            except Exception:
+                logger.exception("Fetching the US data failed")
+            changed = changed or us is not old.us
+
+        if changed:
+            if provinces is None:
+                # Attached to data published without the provinces
+                confirmed, deaths = old.confirmed, old.deaths
+            else:
+                confirmed = provinces.rollup("confirmed")
+                deaths = provinces.rollup("deaths")
+            new = Dataset(
+                confirmed,
+                deaths,
+                sheet,
+                old.wpp_population,
+                us=us,
+                provinces=provinces,
+            )
+            if new.version != old.version:
+                swap(new)
+                logger.info("Data refreshed to version %s", new.version)
+
+    def refresh_us(self, old):
+        """Return the US data, `old` if none of its files changed."""
+        raw = {}
+        for name in SERIES:
+            url = us_series_url(name)
+            timeout = config.FETCH_TIMEOUTS["us"]
+            content, etag = fetch(url, self.us_etags.get(name), timeout)
+            if content is not None:
+                raw[name] = (pd.read_csv(io.BytesIO(content)), etag)
+        if not raw:
+            return old
+
+        etags = {name: etag for name, (_, etag) in raw.items()}
+        frames = {name: parse_us(df) for name, (df, _) in raw.items()}
+        if old is not None and all(
+            _same_frame(df, old.frame(name)) for name, df in frames.items()
+        ):
+            self.us_etags.update(etags)
+            return old
+
+        for name in SERIES:
+            if name in raw:
+                url = us_series_url(name)
+                _write_snapshot(frames[name], "us_" + name, url, etags[name])
+            else:
+                frames[name] = old.frame(name)
+        if "deaths" in raw:
+            population = us_population(raw["deaths"][0])
+            _write_snapshot(
+                population, "us_population", us_series_url("deaths"), etags["deaths"]
+            )
+        else:
+            population = old.population_frame()
+        us = region_store(frames, population, "US")
+        self.us_etags.update(etags)
+        return us
+
+
+class SharedRefresher(Refresher):
+    """Refresher for shared mode, see `shared`.
+
+    One worker at a time holds a lock on the shared directory, refreshes the
+    data from the sources and publishes it. All workers, including that one,
+    attach to the newly published version, so none keeps a private copy.
+    """
+
+    def __init__(self, interval, directory):
+        super().__init__(interval)
+        self.directory = directory
+        self.lock_file = None
+
+    def _acquire(self):
+        import shared
+
+        if self.lock_file is None:
+            # Keep the lock until the process exits, so the same worker keeps
+            # its incremental parsing state
+            self.lock_file = shared.lock(self.directory, blocking=False)
+        return self.lock_file is not None
+
+    def refresh(self):
+        import shared
+
+        if self._acquire():
+            super().refresh()
+            dataset = current()
+            if shared.current_version(self.directory) != dataset.version:
+                shared.publish(dataset, self.directory)
+                # Serve the mapped copy like the other workers, not the
+                # private one the refresh built
+                attached = shared.attach(self.directory, dataset.version)
+                if attached is not None:
+                    swap(attached)
+
+        version = shared.current_version(self.directory)
+        if version is not None and version != current().version:
+            dataset = shared.attach(self.directory, version)
+            if dataset is not None:
+                swap(dataset)
+
+
+_current = None
+_listeners = []
+_refresher = None
+_refresher_pid = None
+_loader_pid = None
+_lock = threading.Lock()
+
+
+def current():
+    """Return the Dataset currently being served, None while loading lazily."""
+    if _current is None:
+        if config.LAZY_START:
+            start_loading()
+    elif config.REFRESH_INTERVAL > 0 and _refresher_pid != os.getpid():
+        start_refresher()
+    return _current
+
+
+def start_loading(retry_interval=30):
+    """Load the data in a background thread of this process, then publish it.
+
+    Used for a lazy start, see `config.LAZY_START`. `current` returns None
+    until the data is loaded. A failed load, e.g. while a source is down, is
+    retried every `retry_interval` seconds.
+    """
+    global _loader_pid
+    with _lock:
+        if _loader_pid == os.getpid():
+            return
+        _loader_pid = os.getpid()
+
+    def run():
+        while True:
+            try:
+                dataset = load_or_attach()
+            except Exception:
+                logger.exception("Loading data failed, retrying")
+                time.sleep(retry_interval)
+                continue
+            swap(dataset)
+            logger.info("Data version %s loaded", dataset.version)
+            return
+
+    threading.Thread(target=run, name="data-loader", daemon=True).start()
+
+
+def swap(dataset):
+    """Publish `dataset`, callbacks starting after this will see it."""
+    global _current
+    _current = dataset
+    for listener in _listeners:
+        listener(dataset)
+
+
+def on_swap(listener):
+    """Call `listener(dataset)` whenever a new Dataset is published."""
+    _listeners.append(listener)
+    return listener
+
+
+def start_refresher():
+    """Start the refresher thread of this process, if not running already.
+
+    The thread is tied to the process that started it, so a forked worker
+    starts its own on first use.
+    """
+    global _refresher, _refresher_pid
+    with _lock:
+        if _refresher_pid == os.getpid():
+            return
+        if config.SHARED_DIR:
+            _refresher = SharedRefresher(config.REFRESH_INTERVAL, config.SHARED_DIR)
+        else:
+            _refresher = Refresher(config.REFRESH_INTERVAL)
+        _refresher.start()
+        _refresher_pid = os.getpid()
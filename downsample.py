@@ -0,0 +1,114 @@
+"""Downsampling of long time series for display.
+
+A graph of 800 pixels width can not show more than about 800 points per trace,
+sending more only costs transfer and render time. The methods here pick a
+subset of the points that looks the same when plotted:
+
+* Largest-Triangle-Three-Buckets (LTTB), see S. Steinarsson, "Downsampling
+  Time Series for Visual Representation", 2013. Keeps the point of each bucket
+  that spans the largest triangle with its neighbours, which preserves peaks
+  and the overall shape.
+* Min-max bucketing, keeps the lowest and highest point of each bucket.
+
+Both keep the first and last point and work on indices, so the same selection
+can be applied to x, y and any other per-point property. Min-max is computed
+for all buckets at once, LTTB needs a loop over the buckets as each choice
+depends on the previous one, which makes it much slower.
+
+Traces are only downsampled when they are more than `MIN_RATIO` times longer
+than the number of points to keep. Thinning out shorter ones saves little, and
+costs more than it saves when the full trace is sent with a compact daily date
+axis, see `encoding`.
+"""
+import numpy as np
+
+
+MIN_RATIO = 2
+
+
+def _finite(x, y):
+    return np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+
+
+def lttb(x, y, n_out):
+    """Indices of `n_out` points of `(x, y)` chosen with LTTB.
+
+    Missing values are dropped. All indices are returned if there are no more
+    than `n_out` points.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = _finite(x, y)
+    if len(valid) <= n_out or n_out < 3:
+        return valid
+    xv = x[valid]
+    yv = y[valid]
+
+    # Buckets for all points except the first and the last
+    edges = np.linspace(1, len(valid) - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = len(valid) - 1
+    previous = 0
+    for ii in range(n_out - 2):
+        start, stop = edges[ii], edges[ii + 1]
+        # The next point is represented by the average of the next bucket
+        if ii + 2 < len(edges):
+            next_x = xv[stop : edges[ii + 2]].mean()
+            next_y = yv[stop : edges[ii + 2]].mean()
+        else:
+            next_x = xv[-1]
+            next_y = yv[-1]
+        area = np.abs(
+            (xv[previous] - next_x) * (yv[start:stop] - yv[previous])
+            - (xv[previous] - xv[start:stop]) * (next_y - yv[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[ii + 1] = previous
+    return valid[selected]
+
+
+def minmax(x, y, n_out):
+    """Indices of about `n_out` points of `(x, y)`, the extremes of each bucket.
+
+    Missing values are dropped. All indices are returned if there are no more
+    than `n_out` points.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = _finite(x, y)
+    if len(valid) <= n_out or n_out < 4:
+        return valid
+    yv = y[valid]
+
+    edges = np.linspace(1, len(valid) - 1, (n_out - 2) // 2 + 1).astype(int)
+    starts = edges[:-1]
+    lengths = edges[1:] - starts
+    starts, lengths = starts[lengths > 0], lengths[lengths > 0]
+    # One row per bucket, padded to the longest one
+    offsets = np.arange(lengths.max())
+    inside = offsets < lengths[:, None]
+    buckets = yv[np.minimum(starts[:, None] + offsets, len(yv) - 1)]
+    lowest = starts + np.where(inside, buckets, np.inf).argmin(axis=1)
+    highest = starts + np.where(inside, buckets, -np.inf).argmax(axis=1)
+
+    pairs = np.sort(np.stack([lowest, highest], axis=1), axis=1)
+    # Keep one point of buckets where both are the same
+    keep = np.ones(pairs.shape, dtype=bool)
+    keep[:, 1] = pairs[:, 1] != pairs[:, 0]
+    selected = np.concatenate([[0], pairs[keep], [len(valid) - 1]])
+    return valid[selected]
+
+
+METHODS = dict(lttb=lttb, minmax=minmax)
+
+
+def select(x, y, n_out, method="minmax"):
+    """Indices of the points to plot, None to plot all of them.
+
+    All points are kept if `n_out` is falsy or `y` has no more than
+    `MIN_RATIO` times `n_out` points.
+    """
+    if not n_out or len(y) <= MIN_RATIO * n_out:
+        return None
+    return METHODS[method](x, y, n_out)
@@ -0,0 +1,106 @@
+"""Compact encoding of the x/y arrays of figure traces.
+
+By default every value of a trace is sent as a float64 in JSON, e.g.
+`0.0024699530214935320`, and every trace repeats the full list of dates. This
+module shortens the payload by
+
+* rounding values to the precision of a float32 (7 significant digits) and
+  sending integral series as integers,
+* replacing a daily date axis by its start and step (`x0`, `dx`), which
+  plotly.js expands in the browser,
+* optionally sending values as base64 encoded typed arrays.
+
+Typed arrays need plotly.js 2.28 or later. The plotly.js bundled with the
+pinned dash version is older, so they are disabled unless
+`COVID_TYPED_ARRAYS=1` is set.
+"""
+import base64
+
+import numpy as np
+import pandas as pd
+
+import config
+
+
+ONE_DAY_MS = 24 * 60 * 60 * 1000
+
+
+def round_significant(values, digits=7):
+    """Round `values` to `digits` significant digits, keeping missing values."""
+    values = np.asarray(values, dtype=float)
+    finite = np.isfinite(values) & (values != 0)
+    magnitude = np.zeros_like(values)
+    magnitude[finite] = np.floor(np.log10(np.abs(values[finite])))
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return np.where(finite, np.round(values * scale) / scale, values)
+
+
+def typed_array(values, dtype="f4"):
+    """Encode `values` as a plotly.js typed array."""
+    values = np.ascontiguousarray(values, dtype=dtype)
+    return dict(dtype=dtype, bdata=base64.b64encode(values.tobytes()).decode("ascii"))
+
+
+def encode_values(values):
+    """Encode one array of trace values as compactly as possible."""
+    values = np.asarray(values, dtype=float)
+    if config.TYPED_ARRAYS:
+        return typed_array(values)
+    finite = np.isfinite(values)
+    if finite.all() and (values == np.round(values)).all():
+        return values.astype(np.int64).tolist()
+    rounded = round_significant(values).astype(object)
+    rounded[~finite] = None
+    return rounded.tolist()
+
+
+def is_daily(dates):
+    """Whether `dates` are consecutive days."""
+    dates = pd.DatetimeIndex(dates)
+    return bool((np.diff(dates.asi8) == ONE_DAY_MS * 1000000).all())
+
+
+def _spans_days(first, x):
+    last = pd.Timestamp(str(np.asarray(x)[-1]))
+    return (last - first).days == len(x) - 1
+
+
+def compact_trace(trace, daily_x=False):
+    """Return a copy of `trace` with compactly encoded x and y.
+
+    Parameters
+    ----------
+    trace : dict
+        Trace as built in `my_dash_functions`.
+    daily_x : bool
+        Whether x holds consecutive days, it is then replaced by `x0` and `dx`.
+        Other dates are sent as they are.
+
+    Returns
+    -------
+    dict
+
+    """
+    trace = dict(trace)
+    x = trace.pop("x")
+    if np.asarray(x).dtype.kind in "MOU":
+        # Dates, as ISO strings or datetimes
+        first = pd.Timestamp(str(np.asarray(x)[0])) if len(x) > 0 else None
+        # Downsampled traces skip days, they need the explicit dates
+        if daily_x and first is not None and _spans_days(first, x):
+            trace["x0"] = first.strftime("%Y-%m-%d")
+            trace["dx"] = ONE_DAY_MS
+        else:
+            trace["x"] = x
+    else:
+        trace["x"] = encode_values(x)
+    trace["y"] = encode_values(trace["y"])
+    return trace
+
+
+def compact_figure(figure, daily_x=False):
+    """Return a copy of `figure` with all traces compactly encoded."""
+    if not config.COMPACT_TRACES:
+        return figure
+    traces = [compact_trace(trace, daily_x) for trace in figure["data"]]
+    return dict(figure, data=traces)
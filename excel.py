@@ -0,0 +1,102 @@
+"""Reading Excel workbooks, opened once and cached by content.
+
+Parsing a workbook is slow, `pd.read_excel` for each sheet even opens and
+unzips the whole file every time. Here a workbook is opened once for all
+requested sheets, or the sheets are parsed in parallel processes, and a parsed
+sheet is kept as a snapshot keyed by the hash of the workbook, see `snapshot`.
+Reading an unchanged workbook again then only costs hashing it and
+memory-mapping the snapshot.
+"""
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import snapshot
+
+
+def content_hash(content):
+    """Short hash identifying the bytes `content` of a workbook."""
+    return hashlib.sha1(content).hexdigest()[:16]
+
+
+def _parse(content, sheet, usecols):
+    with pd.ExcelFile(io.BytesIO(content)) as xl:
+        return xl.parse(sheet, usecols=usecols)
+
+
+def read_sheets(content, sheets=(0,), usecols=None, workers=1):
+    """Parse `sheets` of the workbook `content`.
+
+    Parameters
+    ----------
+    content : bytes
+        The workbook file.
+    sheets : sequence
+        Names or positions of the sheets to read.
+    usecols : list or string
+        Columns to read, all if None, see `pandas.read_excel`.
+    workers : int
+        Number of processes parsing sheets in parallel. With 1 the workbook is
+        opened once and the sheets are parsed one after another.
+
+    Returns
+    -------
+    list
+        One DataFrame per sheet.
+
+    """
+    if workers > 1 and len(sheets) > 1:
+        n_sheets = len(sheets)
+        with ProcessPoolExecutor(min(workers, n_sheets)) as pool:
+            return list(
+                pool.map(_parse, [content] * n_sheets, sheets, [usecols] * n_sheets)
+            )
+    with pd.ExcelFile(io.BytesIO(content)) as xl:
+        return [xl.parse(sheet, usecols=usecols) for sheet in sheets]
+
+
+def cached_sheet(content, cache_dir, name, sheet=0, usecols=None, index=None):
+    """Return one parsed sheet of the workbook `content`, through a snapshot.
+
+    Parameters
+    ----------
+    content : bytes
+        The workbook file.
+    cache_dir : string
+        Directory holding the snapshots.
+    name : string
+        Name of the snapshot.
+    sheet : int or string
+        Sheet to read.
+    usecols : list or string
+        Columns to read, see `read_sheets`.
+    index : string
+        Column holding the row labels, e.g. the dates. The sheet is only
+        cached if this is given and all other columns are numeric, otherwise
+        it is parsed every time.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The sheet, as `pandas.read_excel` returns it.
+
+    """
+    if index is None:
+        return read_sheets(content, [sheet], usecols)[0]
+
+    key = "{}:{}:{}".format(content_hash(content), sheet, usecols)
+    stored = snapshot.read_snapshot(cache_dir, name, source_key=key)
+    if stored is not None:
+        return stored.rename_axis(index).reset_index()
+
+    (df,) = read_sheets(content, [sheet], usecols)
+    values = df.set_index(index)
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in values.dtypes):
+        try:
+            snapshot.write_snapshot(values, cache_dir, name, source_key=key)
+        except OSError:
+            # Not being able to cache should not stop the app
+            pass
+    return df
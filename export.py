@@ -0,0 +1,235 @@
+"""HTTP endpoints serving the processed series, for jobs downstream of the app.
+
+`/api/series/<metric>` returns one derived series of the cube, see `cube.Cube`,
+for any set of countries and range of dates, e.g.::
+
+    /api/series/confirmed?kind=new&norm=per-capita&window=7
+        &country=Sweden&country=Norway&start=2021-01-01&format=arrow
+
+The frame has one row per date and one column per country, like the frames the
+graphs are drawn from. It is streamed as CSV, or as an Arrow IPC stream with
+`format=arrow` or an `Accept: application/vnd.apache.arrow.stream` header.
+Arrow needs pyarrow, which is optional.
+
+Every response carries an ETag derived from the data version and the query.
+A client sending it back in `If-None-Match` gets a 304 before anything is
+computed, as long as the data has not been refreshed.
+"""
+import hashlib
+import io
+import json
+
+import flask
+import pandas as pd
+
+from cube import KINDS
+
+try:
+    import pyarrow as pa
+except ImportError:  # Optional, only needed for Arrow responses
+    pa = None
+
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# Names in the URL and the corresponding names in the cube
+METRICS = {"confirmed": "confirmed cases", "deaths": "deaths"}
+NORMS = {"total": "total", "per-capita": "per capita"}
+
+# Rows per CSV chunk and per Arrow record batch
+CHUNK_ROWS = 256
+
+
+class QueryError(ValueError):
+    """Invalid query parameters, answered with 400."""
+
+
+def parse_query(metric, args, dataset):
+    """Check the parameters of a request and return them normalized.
+
+    Parameters
+    ----------
+    metric : string
+        'confirmed' or 'deaths', from the path.
+    args : werkzeug.datastructures.MultiDict
+        Query parameters: kind, norm, window, country (repeated), start, end.
+    dataset : data.Dataset
+        Data the request is answered from.
+
+    Returns
+    -------
+    dict
+        The parameters, with defaults filled in and dates as ISO strings.
+
+    Raises
+    ------
+    QueryError
+        If a parameter is invalid.
+
+    """
+    if metric not in METRICS:
+        raise QueryError("metric must be one of {}".format(", ".join(METRICS)))
+    kind = args.get("kind", "total")
+    if kind not in KINDS:
+        raise QueryError("kind must be one of {}".format(", ".join(KINDS)))
+    norm = args.get("norm", "total")
+    if norm not in NORMS:
+        raise QueryError("norm must be one of {}".format(", ".join(NORMS)))
+    windows = dataset.cube.windows
+    window = args.get("window", "1")
+    if not window.isdigit() or not 1 <= int(window) <= windows:
+        raise QueryError("window must be an integer from 1 to {}".format(windows))
+
+    # Country names may contain commas, e.g. 'Korea, South', so they are
+    # passed as repeated parameters
+    countries = args.getlist("country") or list(dataset.countries)
+    unknown = sorted(set(countries) - set(dataset.countries))
+    if unknown:
+        raise QueryError("unknown countries: {}".format(", ".join(unknown)))
+
+    dates = {}
+    for bound in ("start", "end"):
+        # An empty value, e.g. from a form, leaves the range open
+        value = args.get(bound) or None
+        try:
+            date = None if value is None else pd.Timestamp(value)
+        except ValueError:
+            date = pd.NaT
+        if date is pd.NaT:
+            raise QueryError("{} must be a date like 2021-01-31".format(bound))
+        dates[bound] = None if date is None else date.isoformat()
+
+    return dict(
+        metric=metric,
+        kind=kind,
+        norm=norm,
+        window=int(window),
+        countries=countries,
+        start=dates["start"],
+        end=dates["end"],
+    )
+
+
+def etag(version, query, fmt):
+    """ETag of the response to `query` in format `fmt` for data `version`."""
+    key = json.dumps([query, fmt], sort_keys=True).encode()
+    return "{}-{}".format(version, hashlib.sha1(key).hexdigest()[:16])
+
+
+def frame(dataset, query):
+    """The series requested by `query`, dates as index and countries as columns."""
+    df = dataset.cube.frame(
+        query["kind"],
+        METRICS[query["metric"]],
+        NORMS[query["norm"]],
+        query["window"],
+        query["countries"],
+    )
+    df = df.loc[query["start"] : query["end"]]
+    df.index = df.index.rename("date")
+    return df
+
+
+def csv_chunks(df, rows=CHUNK_ROWS):
+    """Encode `df` as CSV, `rows` rows at a time."""
+    yield df.iloc[:0].to_csv()
+    for start in range(0, len(df), rows):
+        yield df.iloc[start : start + rows].to_csv(header=False)
+
+
+class _Sink(io.RawIOBase):
+    """File object collecting what is written to it until taken."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_chunks(df, rows=CHUNK_ROWS):
+    """Encode `df` as an Arrow IPC stream, one record batch of `rows` at a time.
+
+    The dates are a date32 column named 'date', followed by one float64
+    column per country.
+    """
+    table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+    table = table.set_column(0, "date", table.column(0).cast(pa.date32()))
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        yield sink.take()
+        for batch in table.to_batches(max_chunksize=rows):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+
+def _wants_arrow(request):
+    fmt = request.args.get("format")
+    if fmt is not None:
+        return fmt == "arrow"
+    best = request.accept_mimetypes.best_match([ARROW_MIMETYPE, "text/csv"])
+    return best == ARROW_MIMETYPE
+
+
+def _error(status, message):
+    return flask.jsonify(error=message), status
+
+
+def register(server, current):
+    """Serve the series of the Dataset returned by `current` on `server`.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    current : callable
+        Returns the Dataset to serve, None while it is loading, e.g.
+        `data.current`.
+
+    """
+
+    @server.route("/api/series/<metric>")
+    def serve_series(metric):
+        request = flask.request
+        fmt = request.args.get("format", "csv")
+        if fmt not in ("csv", "arrow"):
+            return _error(400, "format must be csv or arrow")
+        fmt = "arrow" if _wants_arrow(request) else "csv"
+        if fmt == "arrow" and pa is None:
+            return _error(406, "Arrow responses need pyarrow, use format=csv")
+
+        dataset = current()
+        if dataset is None:
+            return _error(503, "The data is still loading")
+        try:
+            query = parse_query(metric, request.args, dataset)
+        except QueryError as error:
+            return _error(400, str(error))
+
+        tag = etag(dataset.version, query, fmt)
+        headers = {"Cache-Control": "no-cache", "X-Data-Version": dataset.version}
+        if request.if_none_match.contains(tag):
+            response = flask.Response(status=304, headers=headers)
+            response.set_etag(tag)
+            return response
+
+        df = frame(dataset, query)
+        if fmt == "arrow":
+            response = flask.Response(arrow_chunks(df), mimetype=ARROW_MIMETYPE)
+        else:
+            response = flask.Response(csv_chunks(df), mimetype="text/csv")
+        response.headers.update(headers)
+        response.set_etag(tag)
+        return response
+
+    return serve_series
@@ -0,0 +1,99 @@
+"""Downloads of the data sources, over one shared HTTP session.
+
+All requests go through a single `requests.Session`, so connections to the
+same host are reused, and failed requests are retried with backoff on
+connection errors and on 429 and 5xx responses. The session is safe to use
+from the threads loading the sources concurrently, see `data.load`.
+"""
+import hashlib
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+
+def is_local(source):
+    """Whether `source` is a local path rather than a URL."""
+    return "://" not in source
+
+
+# (path, size, mtime) -> blob hash of the files hashed so far
+_fingerprints = {}
+
+
+def file_fingerprint(path):
+    """Return the git blob hash of the local file `path`.
+
+    The hash is the same as git computes, e.g. the one `git ls-files -s` lists
+    for a file of the COVID-19 submodule, and only changes with the content.
+    It is remembered for the size and modification time of the file, so an
+    unchanged file is only read once.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _fingerprints:
+        sha = hashlib.sha1(b"blob %d\0" % stat.st_size)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        _fingerprints[key] = sha.hexdigest()
+    return _fingerprints[key]
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session():
+    """Return the HTTP session shared by all downloads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=config.FETCH_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",),
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=8)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def fetch(url, etag=None, timeout=None):
+    """Return `(content, etag)` for `url`, content is None if unchanged.
+
+    `url` may also be a local path, in which case its git blob hash is used as
+    etag, see `file_fingerprint`.
+
+    Parameters
+    ----------
+    url : string
+        URL or local path.
+    etag : string
+        Etag returned by an earlier call, to skip unchanged content.
+    timeout : float
+        Timeout in seconds of each attempt, defaults to `config.FETCH_TIMEOUT`.
+
+    """
+    if is_local(url):
+        fingerprint = file_fingerprint(url)
+        if fingerprint == etag:
+            return None, etag
+        with open(url, "rb") as f:
+            return f.read(), fingerprint
+
+    if timeout is None:
+        timeout = config.FETCH_TIMEOUT
+    headers = {"If-None-Match": etag} if etag else {}
+    rr = session().get(url, headers=headers, timeout=timeout)
+    if rr.status_code == 304:
+        return None, etag
+    rr.raise_for_status()
+    return rr.content, rr.headers.get("ETag")
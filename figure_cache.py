@@ -0,0 +1,93 @@
+"""Bounded LRU cache for the figures returned by the Dash callbacks.
+
+Most visitors look at the same few combinations of inputs, e.g. the default
+countries per capita with a rolling mean of 7 days. The figures for those are
+built once per data version and then served from memory.
+"""
+import functools
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    """Thread safe least-recently-used cache with hit and miss counters.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of cached figures, 0 disables caching.
+
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # Hits and misses by function, see `memoize`
+        self._functions = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build, function=None):
+        """Return the figure stored under `key`, calling `build` on a miss.
+
+        The hit or miss is also counted for `function`, if given.
+        """
+        with self._lock:
+            counts = None
+            if function is not None:
+                counts = self._functions.setdefault(function, dict(hits=0, misses=0))
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if counts is not None:
+                    counts["hits"] += 1
+                return self._entries[key]
+            self.misses += 1
+            if counts is not None:
+                counts["misses"] += 1
+
+        # Build outside the lock, concurrent misses on the same key just build
+        # the figure twice
+        figure = build()
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key] = figure
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return figure
+
+    def memoize(self, func):
+        """Decorator caching `func(dataset, *args)`.
+
+        The key is made up of the function name, the version of `dataset` and
+        `args`, which must be hashable. Callers should normalize the arguments,
+        e.g. sort lists and turn them into tuples, to get more hits.
+        """
+
+        @functools.wraps(func)
+        def wrapper(dataset, *args):
+            key = (func.__name__, dataset.version) + args
+            return self.get(key, lambda: func(dataset, *args), func.__name__)
+
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters describing how effective the cache is."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+                size=len(self._entries),
+                maxsize=self.maxsize,
+                functions={
+                    name: dict(counts) for name, counts in self._functions.items()
+                },
+            )
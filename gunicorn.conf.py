@@ -0,0 +1,18 @@
+"""gunicorn settings, read automatically when started from this directory."""
+import config
+
+
+def on_starting(server):
+    # In shared mode, publish the data once in the master process before any
+    # worker starts, the workers then only attach to it. With a lazy start the
+    # workers publish it in the background instead, see data.load_or_attach.
+    if config.SHARED_DIR and not config.LAZY_START:
+        import shared
+
+        if shared.current_version(config.SHARED_DIR) is not None:
+            return
+        try:
+            shared.build(config.SHARED_DIR)
+        except Exception:
+            # Start anyway, the workers build it, see data.load_or_attach
+            server.log.exception("Could not publish the data at start-up")
@@ -0,0 +1,113 @@
+"""Memory held by the data of one worker, for sizing the number of workers.
+
+`report` lists the size of every part of a Dataset, whether it is held in the
+worker's own memory or memory-mapped from a snapshot, see `snapshot` and
+`shared`, and the resident size of the process. Mapped pages are shared with
+other workers mapping the same files, private ones are not, so the private
+total is what each additional worker costs.
+
+The app serves the report of the worker answering on `/memory`. With
+`COVID_COMPACT_DATA=1` the data is held in smaller types, see `config`; compare
+both with `python -m benchmarks.memory`.
+"""
+import mmap
+import os
+import resource
+
+import numpy as np
+
+import config
+
+
+def _mapped(values):
+    """Whether the array `values` is a view of a memory-mapped file."""
+    while values is not None:
+        if isinstance(values, (np.memmap, mmap.mmap)):
+            return True
+        values = getattr(values, "base", None)
+    return False
+
+
+def _array(values):
+    return dict(
+        bytes=int(values.nbytes), dtype=str(values.dtype), mapped=_mapped(values)
+    )
+
+
+def _frame(df):
+    """Size of the values of `df` and, separately, of its labels."""
+    if len(set(df.dtypes)) == 1:
+        entry = _array(df.values)
+    else:
+        # Mixed types, `values` would be a copy
+        entry = dict(
+            bytes=int(df.memory_usage(index=False, deep=True).sum()),
+            dtype="mixed",
+            mapped=False,
+        )
+    entry["labels_bytes"] = int(
+        df.index.memory_usage(deep=True) + df.columns.memory_usage(deep=True)
+    )
+    return entry
+
+
+def _store(store):
+    arrays = [_array(block) for block in store.values.values()]
+    labels = store.children.memory_usage(deep=True) + store.parents.memory_usage(
+        deep=True
+    )
+    return dict(
+        bytes=sum(entry["bytes"] for entry in arrays),
+        dtype="/".join(sorted({entry["dtype"] for entry in arrays})),
+        mapped=all(entry["mapped"] for entry in arrays),
+        labels_bytes=int(labels + store.parent_codes.nbytes),
+    )
+
+
+def resident_bytes():
+    """Resident set size of this process, its peak if the current is unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def report(dataset):
+    """Memory held by `dataset` and by this process.
+
+    Returns
+    -------
+    dict
+        With the process id, whether compact types are used, the resident
+        size, one entry per part of the Dataset with its size, type and
+        whether it is mapped, and the private and mapped totals in bytes.
+
+    """
+    parts = {}
+    if dataset is not None:
+        parts["confirmed"] = _frame(dataset.confirmed)
+        parts["deaths"] = _frame(dataset.deaths)
+        parts["cube"] = _array(dataset.cube.values)
+        parts["sweden_sheet"] = _frame(dataset.sheet)
+        parts["sweden_regions"] = _array(dataset.regions.values)
+        parts["wpp_population"] = _frame(dataset.wpp_population.to_frame())
+        if dataset.provinces is not None:
+            parts["provinces"] = _store(dataset.provinces)
+        if dataset.us is not None:
+            parts["us"] = _store(dataset.us)
+
+    totals = dict(private_bytes=0, mapped_bytes=0)
+    for entry in parts.values():
+        size = entry["bytes"] + entry.get("labels_bytes", 0)
+        totals["mapped_bytes" if entry["mapped"] else "private_bytes"] += size
+    return dict(
+        pid=os.getpid(),
+        compact=config.COMPACT_DATA,
+        version=None if dataset is None else dataset.version,
+        resident_bytes=resident_bytes(),
+        parts=parts,
+        **totals,
+    )
+
@@ -0,0 +1,222 @@
+"""Latency, payload and cache metrics of the Dash callbacks.
+
+Every callback request to `/_dash-update-component` is timed in Flask request
+hooks and recorded per callback, identified by its output, e.g.
+`graph1.figure`. Together with the counters of the figure cache the metrics
+are served in the Prometheus text format on `/metrics`.
+
+Recording takes a few microseconds per request. The metrics are kept per
+process, with several gunicorn workers each scrape sees the worker that
+answered it.
+"""
+import bisect
+import threading
+import time
+
+import flask
+
+
+DASH_CALLBACK_PATH = "/_dash-update-component"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1e3, 4e3, 16e3, 64e3, 256e3, 1e6, 4e6, 16e6)
+CARDINALITY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Inputs whose number of values is recorded as the input cardinality
+COUNTRY_INPUTS = (("country_dropdown", "value"), ("selection", "data"))
+
+
+class Histogram:
+    """Counts of observations by upper bound, as a Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        """Lines of the text format for this histogram."""
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            le = bound if isinstance(bound, str) else "{:g}".format(bound)
+            yield "{}_bucket{} {}".format(name, _labels(labels, le=le), cumulative)
+        yield "{}_sum{} {:g}".format(name, _labels(labels), self.sum)
+        yield "{}_count{} {}".format(name, _labels(labels), cumulative)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    pairs = ('{}="{}"'.format(key, _escape(value)) for key, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metrics:
+    """Metrics of the callbacks of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._size = {}
+        self._cardinality = {}
+        self._responses = {}
+
+    def observe(self, callback, status, seconds, size=None, cardinality=None):
+        """Record one callback request.
+
+        Parameters
+        ----------
+        callback : string
+            Id of the callback, its output.
+        status : int
+            HTTP status of the response, 204 when the update was prevented.
+        seconds : float
+            Time taken to answer.
+        size : int
+            Size of the response body in bytes, if known.
+        cardinality : int
+            Number of selected countries, if the callback takes them.
+
+        """
+        with self._lock:
+            _histogram(self._latency, callback, LATENCY_BUCKETS).observe(seconds)
+            if size is not None:
+                _histogram(self._size, callback, SIZE_BUCKETS).observe(size)
+            if cardinality is not None:
+                histogram = _histogram(self._cardinality, callback, CARDINALITY_BUCKETS)
+                histogram.observe(cardinality)
+            key = (callback, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def render(self, figure_cache=None):
+        """All metrics in the Prometheus text format."""
+        with self._lock:
+            lines = []
+            for name, kind, help_text, series in [
+                (
+                    "dash_callback_duration_seconds",
+                    "histogram",
+                    "Time taken to answer a callback request.",
+                    self._latency,
+                ),
+                (
+                    "dash_callback_response_bytes",
+                    "histogram",
+                    "Size of the callback responses.",
+                    self._size,
+                ),
+                (
+                    "dash_callback_selected_countries",
+                    "histogram",
+                    "Number of countries selected when the callback was called.",
+                    self._cardinality,
+                ),
+            ]:
+                lines += _header(name, kind, help_text)
+                for callback, histogram in sorted(series.items()):
+                    lines += histogram.lines(name, dict(callback=callback))
+
+            lines += _header(
+                "dash_callback_responses_total", "counter", "Callback responses."
+            )
+            for (callback, status), count in sorted(self._responses.items()):
+                labels = _labels(dict(callback=callback, status=status))
+                lines.append("dash_callback_responses_total{} {}".format(labels, count))
+
+        if figure_cache is not None:
+            stats = figure_cache.stats()
+            for kind in ("hits", "misses"):
+                name = "figure_cache_{}_total".format(kind)
+                lines += _header(name, "counter", "Figure cache {}.".format(kind))
+                for function, counts in sorted(stats["functions"].items()):
+                    labels = _labels(dict(function=function))
+                    lines.append("{}{} {}".format(name, labels, counts[kind]))
+            for kind, help_text in [
+                ("size", "Figures in the cache."),
+                ("maxsize", "Maximum number of figures in the cache."),
+            ]:
+                name = "figure_cache_{}".format(kind)
+                lines += _header(name, "gauge", help_text)
+                lines.append("{} {}".format(name, stats[kind]))
+        return "\n".join(lines) + "\n"
+
+
+def _histogram(histograms, callback, buckets):
+    if callback not in histograms:
+        histograms[callback] = Histogram(buckets)
+    return histograms[callback]
+
+
+def _header(name, kind, help_text):
+    return ["# HELP {} {}".format(name, help_text), "# TYPE {} {}".format(name, kind)]
+
+
+def _cardinality(body):
+    """Number of selected countries among the inputs of a callback request."""
+    for item in body.get("inputs", []):
+        if not isinstance(item, dict):
+            # Pattern matching inputs come as lists
+            continue
+        if (item.get("id"), item.get("property")) in COUNTRY_INPUTS:
+            return len(item.get("value") or [])
+    return None
+
+
+def instrument(server, figure_cache=None, metrics=None):
+    """Record the callback metrics of `server` and serve them on `/metrics`.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The server of the Dash app.
+    figure_cache : figure_cache.FigureCache
+        Cache whose counters are served as well.
+    metrics : Metrics
+        Where to record, a new one by default.
+
+    Returns
+    -------
+    Metrics
+
+    """
+    if metrics is None:
+        metrics = Metrics()
+
+    @server.before_request
+    def start_timer():
+        if flask.request.path == DASH_CALLBACK_PATH:
+            flask.g.callback_start = time.perf_counter()
+
+    @server.after_request
+    def record(response):
+        start = flask.g.pop("callback_start", None)
+        if start is None:
+            return response
+        body = flask.request.get_json(silent=True) or {}
+        metrics.observe(
+            str(body.get("output", "unknown")),
+            response.status_code,
+            time.perf_counter() - start,
+            response.calculate_content_length(),
+            _cardinality(body),
+        )
+        return response
+
+    @server.route("/metrics")
+    def serve_metrics():
+        return flask.Response(
+            metrics.render(figure_cache),
+            mimetype="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+    return metrics
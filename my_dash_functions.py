@@ -3,25 +3,68 @@ import plotly.graph_objects as go
 import numpy as np
 from datetime import datetime
 
-from utils import datetimeify
+import downsample
+from cube import RegionViews
+from utils import iso_dates
 
 
 width = 2
 
 
-def total_vs_time(df, descr):
-    date_list = datetimeify(df.index)
+def downsampled(x, y, max_points=None, method="minmax", x_values=None, y_values=None):
+    """Return `x` and `y` reduced to about `max_points` points for display.
+
+    Parameters
+    ----------
+    x, y : array-like
+        Coordinates of the trace. Only the first `len(x)` values of `y` are
+        kept if `y` is longer, as plotly would.
+    max_points : int
+        Number of points to keep, no downsampling if None or 0 or if there
+        are no more than `downsample.MIN_RATIO` times as many.
+    method : string
+        'lttb' or 'minmax', see `downsample`.
+    x_values, y_values : array-like
+        Numeric coordinates used to pick the points, defaults to the position
+        in the series and `y`.
+
+    Returns
+    -------
+    tuple
+        The reduced `x` and `y`, or the originals if nothing was dropped.
+
+    """
+    n = min(len(x), len(y))
+    if not max_points or n <= downsample.MIN_RATIO * max_points:
+        return x, y
+    if x_values is None:
+        x_values = np.arange(n)
+    if y_values is None:
+        y_values = y
+    idx = downsample.select(
+        np.asarray(x_values, dtype=float)[:n],
+        np.asarray(y_values, dtype=float)[:n],
+        max_points,
+        method,
+    )
+    return np.asarray(x)[idx], np.asarray(y, dtype=float)[idx]
+
+
+def total_vs_time(df, descr, dates=None, max_points=None, method="minmax"):
+    if dates is None:
+        dates = iso_dates(df.index)
 
     traces = []
     # Add traces, one for each slider step
     for ii, country in enumerate(df.keys()):
+        x, y = downsampled(dates, df[country], max_points, method)
         traces.append(
             dict(
                 line=dict(width=width),
                 mode="lines+markers",
                 name=str(country),
-                x=date_list,
-                y=df[country],
+                x=x,
+                y=y,
             )
         )
 
@@ -32,19 +75,27 @@ def total_vs_time(df, descr):
     return traces, layout
 
 
-def new_vs_total(df, window=1):
+def new_vs_total(total, new, window=1, max_points=None, method="minmax"):
+    """Traces of new vs. total counts, both as rolling means over `window` days."""
     # Create figure
     traces = []
 
     # Add traces, one for each slider step
-    for country in df.keys():
+    for country in total.keys():
+        # Both axes are logarithmic, pick the points as they are shown
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_total = np.log10(total[country].to_numpy())
+            log_new = np.log10(new[country].to_numpy())
+        x, y = downsampled(
+            total[country], new[country], max_points, method, log_total, log_new
+        )
         traces.append(
             dict(
                 line=dict(width=width),
                 name=str(country),
                 mode="lines+markers",
-                x=df[country].rolling(window=window).mean(),
-                y=df.diff()[country].rolling(window=window).mean(),
+                x=x,
+                y=y,
             )
         )
 
@@ -57,20 +108,24 @@ def new_vs_total(df, window=1):
     return traces, layout
 
 
-def new_vs_time(df, descr, window=1):
-    date_list = datetimeify(df.index)
+def new_vs_time(new, descr, window=1, dates=None, max_points=None, method="minmax"):
+    """Traces of new counts per day, `new` holds rolling means over `window` days."""
+    if dates is None:
+        dates = iso_dates(new.index)
+    new = new.iloc[39:]
 
     # Create figure
     traces = []
     # Add traces, one for each slider step
-    for ii, country in enumerate(df.keys()):
+    for ii, country in enumerate(new.keys()):
+        x, y = downsampled(dates[39:], new[country], max_points, method)
         traces.append(
             dict(
                 line=dict(width=width),
                 mode="lines+markers",
                 name=str(country),
-                x=date_list[39:],
-                y=df.iloc[39:].diff()[country].rolling(window).mean(),
+                x=x,
+                y=y,
             )
         )
 
@@ -84,36 +139,48 @@ def new_vs_time(df, descr, window=1):
     return traces, layout
 
 
-def landskap(df, total=False, window=1):
-    df = df.copy()
+def landskap(df, total=False, window=1, max_points=None, method="minmax"):
+    """Traces of the Swedish regions, computing the views from the sheet `df`.
 
-    dates = df.pop("Statistikdatum")
+    The app uses `region_traces` with the views precomputed per Dataset.
+    """
+    return region_traces(RegionViews(df), total, window, max_points, method)
 
-    sorted_df = df.sort_values(by=len(df) - 2, axis=1, ascending=False)
-    df = sorted_df
-    visible = ["legendonly" for i in range(len(df))]
-    for ii in range(4):
-        visible[ii] = True
-    scania_idx = df.columns.get_loc("Skåne")
-    visible[scania_idx] = True
 
+def region_traces(views, total=False, window=1, max_points=None, method="minmax"):
+    """Traces of new or total cases per Swedish region.
+
+    Parameters
+    ----------
+    views : cube.RegionViews
+        Precomputed series of the regions.
+    total : bool
+        Show cumulative instead of new cases.
+    window : int
+        Rolling mean window in days.
+    max_points, method
+        Downsampling of the traces, see `downsampled`.
+
+    """
+    dates = views.dates
+    values = views.series("total" if total else "new", window)
     if total:
-        df = df.cumsum()
         dates = dates[1:]
 
     # Create figure
     traces = []
 
     # Add traces, one for each slider step
-    for ii, landskap in enumerate(df.keys()):
+    for ii, landskap in enumerate(views.regions):
+        x, y = downsampled(dates, values[: len(dates), ii], max_points, method)
         traces.append(
             dict(
                 line=dict(width=width),
-                name=str(landskap),
+                name=landskap,
                 mode="lines+markers",
-                visible=visible[ii],
-                x=dates,
-                y=df[landskap].rolling(window=window).mean(),
+                visible=views.visible[ii],
+                x=x,
+                y=y,
             )
         )
 
@@ -124,3 +191,49 @@ def landskap(df, total=False, window=1):
         height=600,
     )
     return traces, layout
+
+
+def regions_vs_time(
+    df, title, dates=None, n_visible=5, max_points=None, method="minmax"
+):
+    """Traces of the regions in `df`, e.g. the counties of a US state.
+
+    Only the `n_visible` regions with the highest last value are shown, the
+    others are listed in the legend. The regions are ordered by that value.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dates as index and one column per region.
+    title : string
+        Title of the figure.
+    dates : list
+        ISO dates of the index, computed if None.
+    n_visible : int
+        Number of regions shown initially.
+    max_points, method
+        Downsampling of the traces, see `downsampled`.
+
+    """
+    if dates is None:
+        dates = iso_dates(df.index)
+    values = df.to_numpy(dtype=float)
+    last = values[-1] if len(values) else np.zeros(values.shape[1])
+    order = np.argsort(-np.nan_to_num(last, nan=-np.inf), kind="stable")
+
+    traces = []
+    for rank, ii in enumerate(order):
+        x, y = downsampled(dates, values[:, ii], max_points, method)
+        traces.append(
+            dict(
+                line=dict(width=width),
+                mode="lines+markers",
+                name=str(df.columns[ii]),
+                visible=True if rank < n_visible else "legendonly",
+                x=x,
+                y=y,
+            )
+        )
+
+    layout = dict(title=title, autosize=True, width=800, height=600)
+    return traces, layout
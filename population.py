@@ -0,0 +1,71 @@
+"""Population data from the UN World Population Prospects 2019 (WPP)."""
+import pandas as pd
+
+
+# JHU country names that differ from the WPP location names
+JHU_TO_WPP = {
+    "Bolivia": "Bolivia (Plurinational State of)",
+    "Brunei": "Brunei Darussalam",
+    "Burma": "Myanmar",
+    "Congo (Brazzaville)": "Congo",
+    "Congo (Kinshasa)": "Democratic Republic of the Congo",
+    "Cote d'Ivoire": "Côte d'Ivoire",
+    "Iran": "Iran (Islamic Republic of)",
+    "Korea, North": "Dem. People's Republic of Korea",
+    "Korea, South": "Republic of Korea",
+    "Laos": "Lao People's Democratic Republic",
+    "Micronesia": "Micronesia (Fed. States of)",
+    "Moldova": "Republic of Moldova",
+    "Russia": "Russian Federation",
+    "Syria": "Syrian Arab Republic",
+    "Taiwan*": "China, Taiwan Province of China",
+    "Tanzania": "United Republic of Tanzania",
+    "UK": "United Kingdom",
+    "US": "United States of America",
+    "Venezuela": "Venezuela (Bolivarian Republic of)",
+    "Vietnam": "Viet Nam",
+    "West Bank and Gaza": "State of Palestine",
+}
+
+
+def load_population(file_path, year=2020, variant="Medium"):
+    """Read the total population per location from a WPP CSV file.
+
+    Parameters
+    ----------
+    file_path : string
+        Path to WPP2019_TotalPopulationBySex.csv.
+    year : int
+        Year of the estimate.
+    variant : string
+        Projection variant.
+
+    Returns
+    -------
+    pandas.Series
+        Total population in thousands, indexed by WPP location name.
+
+    """
+    df = pd.read_csv(file_path, usecols=["Location", "Time", "Variant", "PopTotal"])
+    df = df[(df["Time"] == year) & (df["Variant"] == variant)]
+    return df.drop_duplicates("Location").set_index("Location")["PopTotal"]
+
+
+def align_population(population, countries):
+    """Return the population of each JHU country in `countries`.
+
+    Parameters
+    ----------
+    population : pandas.Series
+        Population indexed by WPP location name, see `load_population`.
+    countries : list
+        JHU country names.
+
+    Returns
+    -------
+    pandas.Series
+        Population indexed by `countries`, NaN where no match was found.
+
+    """
+    locations = [JHU_TO_WPP.get(country, country) for country in countries]
+    return pd.Series(population.reindex(locations).to_numpy(), index=countries)
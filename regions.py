@@ -0,0 +1,380 @@
+"""Time series of regions in a two level hierarchy, e.g. US states and counties.
+
+JHU publishes the US data per county, about 3300 of them, each with more than
+a thousand dates, and the global data per country and province. A
+`RegionStore` keeps these in one compact numeric block per metric, with the
+regions sorted by their parent so that the children of a parent are a
+contiguous slice. Drilling down to the counties of a state is then a view of
+the block, and the states themselves are summed up once per data version.
+Neither depends on the total number of counties.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+import config
+from cube import rolling_means
+from encoding import is_daily
+from utils import parse_dates, sum_by_key
+
+
+# Joins the parent and child name in the column labels of `RegionStore.frame`
+SEPARATOR = "|"
+
+# Columns of the JHU US time series that are not dates
+US_METADATA = [
+    "UID",
+    "iso2",
+    "iso3",
+    "code3",
+    "FIPS",
+    "Admin2",
+    "Province_State",
+    "Country_Region",
+    "Lat",
+    "Long_",
+    "Combined_Key",
+    "Population",
+]
+
+
+def compact(values):
+    """Return `values` as int32 if they are all integral and fit, else float64."""
+    values = np.asarray(values)
+    if values.dtype == np.int32:
+        return values
+    if values.dtype.kind in "iu" or (
+        values.dtype.kind == "f"
+        and np.isfinite(values).all()
+        and (values == np.round(values)).all()
+    ):
+        if values.size == 0 or (
+            values.min() >= np.iinfo(np.int32).min
+            and values.max() <= np.iinfo(np.int32).max
+        ):
+            return values.astype(np.int32)
+    return values.astype(np.float64, copy=False)
+
+
+def _sum_groups(block, starts, counts):
+    """Sum the column groups of `block` starting at `starts`, like `sum_by_key`.
+
+    Sums of integers are int64, or int32 when they fit with
+    `config.COMPACT_DATA`, like the blocks of `RegionStore`.
+    """
+    if len(starts) == 0:
+        return np.zeros((block.shape[0], 0))
+    if block.dtype.kind == "f":
+        sums = np.add.reduceat(np.nan_to_num(block), starts, axis=1)
+        single = counts == 1
+        sums[:, single] = block[:, starts[single]]
+        return sums
+    sums = np.add.reduceat(block, starts, axis=1, dtype=np.int64)
+    return compact(sums) if config.COMPACT_DATA else sums
+
+
+class RegionStore:
+    """Time series of several metrics for regions grouped by a parent region.
+
+    Parameters
+    ----------
+    values : dict
+        2D array per metric, dates along the first axis and one column per
+        region. The blocks are stored as int32 when possible.
+    index : pandas.DatetimeIndex
+        Dates of the rows.
+    parents : array-like
+        Name of the parent of each region, e.g. its state.
+    children : array-like
+        Name of each region within its parent, e.g. its county. Missing names
+        are replaced by the name of the parent.
+    population : array-like
+        Population of each region in persons, or None if unknown.
+
+    """
+
+    def __init__(self, values, index, parents, children, population=None):
+        parents = np.asarray(parents, dtype=object)
+        children = np.array(children, dtype=object)
+        missing = pd.isna(children)
+        children[missing] = parents[missing]
+
+        # Parents in order of first appearance, regions sorted by parent
+        codes, parent_names = pd.factorize(parents)
+        order = np.argsort(codes, kind="stable")
+        ordered = bool((order == np.arange(len(order))).all())
+
+        self.index = pd.DatetimeIndex(index)
+        self.dates = list(self.index.strftime("%Y-%m-%d"))
+        self.daily = is_daily(self.index)
+        self.parents = pd.Index(parent_names)
+        self.children = pd.Index(children if ordered else children[order])
+        self.parent_codes = codes[order].astype(np.int32)
+        self.values = {
+            metric: compact(block if ordered else np.asarray(block)[:, order])
+            for metric, block in values.items()
+        }
+        if population is not None:
+            population = np.asarray(population, dtype=float)
+            population = population if ordered else population[order]
+        self.population = population
+
+        self.starts = np.searchsorted(self.parent_codes, np.arange(len(self.parents)))
+        self.stops = np.append(self.starts[1:], len(self.children)).astype(int)
+        self._rollups = {}
+        self._lock = threading.Lock()
+
+    @property
+    def metrics(self):
+        return list(self.values)
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.values.values())
+
+    def memory_usage(self):
+        """Human readable shape and size of the blocks."""
+        dtypes = sorted({str(block.dtype) for block in self.values.values()})
+        return "{} metrics of shape {}, {} ({:.1f} MB)".format(
+            len(self.values),
+            (len(self.index), len(self.children)),
+            "/".join(dtypes),
+            self.nbytes / 1e6,
+        )
+
+    def _slice(self, parent):
+        position = self.parents.get_loc(parent)
+        return slice(self.starts[position], self.stops[position])
+
+    def rollup(self, metric):
+        """Series of `metric` summed up per parent, computed once.
+
+        Missing values are skipped, except for parents with a single region,
+        the same as `utils.process_df`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dates as index, parents as columns.
+
+        """
+        with self._lock:
+            if metric not in self._rollups:
+                sums = _sum_groups(
+                    self.values[metric], self.starts, self.stops - self.starts
+                )
+                self._rollups[metric] = pd.DataFrame(
+                    sums, index=self.index, columns=self.parents
+                )
+            return self._rollups[metric]
+
+    def parent_population(self):
+        """Population of each parent, NaN if unknown."""
+        if self.population is None:
+            return pd.Series(np.nan, index=self.parents)
+        sums = np.add.reduceat(np.nan_to_num(self.population), self.starts)
+        return pd.Series(sums if len(self.starts) else [], index=self.parents)
+
+    def children_of(self, metric, parent):
+        """Series of `metric` of the regions of `parent`, a view of the block.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dates as index, the names of the children as columns.
+
+        """
+        part = self._slice(parent)
+        return pd.DataFrame(
+            self.values[metric][:, part],
+            index=self.index,
+            columns=self.children[part],
+            copy=False,
+        )
+
+    def children_population(self, parent):
+        """Population of the regions of `parent`, NaN if unknown."""
+        part = self._slice(parent)
+        if self.population is None:
+            return pd.Series(np.nan, index=self.children[part])
+        return pd.Series(self.population[part], index=self.children[part])
+
+    def series(self, metric, kind, window, parent=None, per_capita=False):
+        """Derived series of the parents, or of the regions of one parent.
+
+        Parameters
+        ----------
+        metric : string
+            One of `metrics`.
+        kind : string
+            'total' for cumulative counts, 'new' for new counts per day.
+        window : int
+            Length of the rolling mean in days, 1 for none.
+        parent : string
+            Parent whose regions to return, the parents themselves if None.
+        per_capita : bool
+            Per 100,000 inhabitants. Regions of unknown population are NaN.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dates as index, parents or regions as columns.
+
+        """
+        if parent is None:
+            df = self.rollup(metric)
+            population = self.parent_population()
+        else:
+            df = self.children_of(metric, parent)
+            population = self.children_population(parent)
+        values = df.to_numpy(dtype=float)
+        if per_capita:
+            population = population.to_numpy()
+            population = np.where(population > 0, population, np.nan)
+            values = values * (1e5 / population)
+        if kind == "new":
+            new = np.full_like(values, np.nan)
+            new[1:] = np.diff(values, axis=0)
+            values = new
+        if window > 1:
+            values = rolling_means(values, window)[-1]
+        return pd.DataFrame(values, index=self.index, columns=df.columns)
+
+    def frame(self, metric):
+        """All regions of `metric` as a DataFrame, columns 'parent|child'."""
+        return pd.DataFrame(
+            self.values[metric], index=self.index, columns=self.keys(), copy=False
+        )
+
+    def population_frame(self):
+        """Population as a one row frame labelled like `frame`, or None."""
+        if self.population is None:
+            return None
+        return pd.DataFrame(
+            [self.population], index=["population"], columns=self.keys()
+        )
+
+    def keys(self):
+        """Labels of the regions, parent and child joined by `SEPARATOR`."""
+        parents = self.parents[self.parent_codes]
+        return [
+            "{}{}{}".format(parent, SEPARATOR, child)
+            for parent, child in zip(parents, self.children)
+        ]
+
+    @classmethod
+    def from_frames(cls, frames, population=None):
+        """Build a store from frames as returned by `frame`, e.g. snapshots.
+
+        Parameters
+        ----------
+        frames : dict
+            DataFrame per metric, all with the same columns.
+        population : pandas.DataFrame
+            Population as returned by `population_frame`, or None.
+
+        """
+        first = next(iter(frames.values()))
+        keys = first.columns.str.split(SEPARATOR, n=1)
+        return cls(
+            {metric: df.to_numpy() for metric, df in frames.items()},
+            first.index,
+            keys.str[0],
+            keys.str[1],
+            None if population is None else population[first.columns].iloc[0],
+        )
+
+
+def region_rows(values, parents, children):
+    """Labels 'parent|child' of the rows of a JHU file and their values.
+
+    The rows are grouped by parent, parents in order of first appearance. It
+    is the order of `RegionStore`, so a store built from the parsed frames
+    keeps them as they are. Missing child names are replaced by the name of
+    the parent. Repeated labels are summed like `utils.sum_by_key` does, so
+    the sums per parent are the same as those of `utils.process_df`.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array with one row per label.
+    parents, children : array-like
+        Name of the parent and the child of each row.
+
+    Returns
+    -------
+    tuple
+        Array of the unique labels and array of their values, one row each.
+
+    """
+    parents = pd.Series(parents).astype(str).reset_index(drop=True)
+    children = pd.Series(children).reset_index(drop=True)
+    children = children.where(children.notna(), parents).astype(str)
+    keys = (parents + SEPARATOR + children).to_numpy()
+    codes, uniques = pd.factorize(keys)
+    if len(uniques) < len(keys):
+        # First row of each label, in the order sum_by_key returns them
+        _, first = np.unique(codes, return_index=True)
+        keys, values = sum_by_key(np.asarray(values), keys)
+        parents = parents[first].reset_index(drop=True)
+    parent_codes, _ = pd.factorize(parents)
+    order = np.argsort(parent_codes, kind="stable")
+    return keys[order], np.asarray(values)[order]
+
+
+def _us_rows(df, values):
+    return region_rows(values, df["Province_State"], df["Admin2"])
+
+
+def parse_global(df):
+    """Counts of a JHU global time series by country and province.
+
+    Unlike `utils.process_df`, the provinces are kept. Their sums per country,
+    `RegionStore.rollup`, are the same as the frame `process_df` returns.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Raw frame as returned by `utils.get_frame`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Dates as index and one column per province, labelled
+        'country|province' as in `RegionStore.frame`. Countries without
+        provinces are labelled 'country|country'. Stored as int32 when
+        possible.
+
+    """
+    dates = df.drop(columns=["Province/State", "Lat", "Long"])
+    keys, values = region_rows(dates.to_numpy(), df.index, df["Province/State"])
+    values = compact(values.T)
+    return pd.DataFrame(values, index=parse_dates(dates.columns), columns=keys)
+
+
+def parse_us(df):
+    """Counts of a JHU US time series by county.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        A time_series_covid19_*_US.csv file as read by `pandas.read_csv`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Dates as index and one column per county, labelled 'state|county' as
+        in `RegionStore.frame`. Stored as int32 when possible.
+
+    """
+    dates = df.drop(columns=[col for col in US_METADATA if col in df.columns])
+    keys, values = _us_rows(df, dates.to_numpy())
+    values = compact(values.T)
+    return pd.DataFrame(values, index=parse_dates(dates.columns), columns=keys)
+
+
+def us_population(df):
+    """Population per county of a JHU US deaths file, as a one row frame."""
+    keys, population = _us_rows(df, df[["Population"]].to_numpy(dtype=float))
+    return pd.DataFrame(population.T, index=["population"], columns=keys)
@@ -0,0 +1,188 @@
+"""Search index for the options of the country dropdown.
+
+The dropdown asks the server for matching options on every keystroke. Instead
+of scanning all labels each time, the names are normalized once (lower case,
+accents removed, punctuation as spaces) and kept sorted, so that the most
+relevant matches are found with a binary search:
+
+1. the whole name or an alias equals the query, e.g. "usa" -> "US",
+2. the name starts with the query,
+3. a word of the name starts with the query, e.g. "south" -> "Korea, South",
+4. the query appears anywhere in the name,
+5. only if nothing matched, names close to the query, e.g. "swedn" -> "Sweden".
+"""
+import bisect
+import difflib
+import re
+import unicodedata
+
+from population import JHU_TO_WPP
+
+
+# Other common names of JHU countries, the WPP names are added as well
+ALIASES = {
+    "USA": "US",
+    "United States": "US",
+    "America": "US",
+    "Great Britain": "United Kingdom",
+    "Britain": "United Kingdom",
+    "England": "United Kingdom",
+    "South Korea": "Korea, South",
+    "North Korea": "Korea, North",
+    "Czech Republic": "Czechia",
+    "Ivory Coast": "Cote d'Ivoire",
+    "Myanmar": "Burma",
+    "Taiwan": "Taiwan*",
+    "Palestine": "West Bank and Gaza",
+    "DRC": "Congo (Kinshasa)",
+    "UAE": "United Arab Emirates",
+}
+ALIASES.update({wpp: jhu for jhu, wpp in JHU_TO_WPP.items()})
+
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text):
+    """Lower case `text` without accents and with punctuation as single spaces."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _SEPARATORS.sub(" ", text.casefold()).strip()
+
+
+def _prefixed(keys, prefix):
+    """Slice of the sorted `keys` starting with `prefix`."""
+    start = bisect.bisect_left(keys, prefix)
+    stop = bisect.bisect_left(keys, prefix + "\uffff", lo=start)
+    return start, stop
+
+
+class SearchIndex:
+    """Ranked lookup of dropdown options by name or alias.
+
+    Parameters
+    ----------
+    options : list
+        Dropdown options, dicts with 'label' and 'value'.
+    aliases : dict
+        Other names of the options, mapping alias to option value. Aliases of
+        values not among `options` are ignored.
+
+    """
+
+    def __init__(self, options, aliases=None):
+        self.options = list(options)
+        self._position = {o["value"]: ii for ii, o in enumerate(self.options)}
+
+        # All names to match, the labels first
+        names = [(normalize(o["label"]), ii) for ii, o in enumerate(self.options)]
+        for alias, value in (aliases or {}).items():
+            if value in self._position:
+                names.append((normalize(alias), self._position[value]))
+        names = [(key, ii) for key, ii in names if key]
+
+        names.sort()
+        self._names = [key for key, ii in names]
+        self._name_positions = [ii for key, ii in names]
+
+        words = sorted(
+            (word, ii) for key, ii in names for word in set(key.split(" ")[1:])
+        )
+        self._words = [word for word, ii in words]
+        self._word_positions = [ii for word, ii in words]
+
+        # The labels joined to a single string, for fast substring search
+        labels = [normalize(o["label"]) for o in self.options]
+        self._haystack = "\n".join(labels)
+        self._starts = []
+        offset = 0
+        for label in labels:
+            self._starts.append(offset)
+            offset += len(label) + 1
+
+        # Search terms used by the dropdown to filter the options in the
+        # browser, so that aliases and unaccented names are not filtered out
+        terms = {}
+        for key, ii in names:
+            terms.setdefault(ii, []).append(key)
+        self.options = [
+            dict(o, search=" ".join(terms.get(ii, [o["label"]])))
+            for ii, o in enumerate(self.options)
+        ]
+
+    def __len__(self):
+        return len(self.options)
+
+    def get(self, values):
+        """Options of `values`, unknown values are skipped."""
+        return [
+            self.options[self._position[value]]
+            for value in values
+            if value in self._position
+        ]
+
+    def _substring(self, query):
+        """Positions of the options whose label contains `query`."""
+        found = self._haystack.find(query)
+        while found != -1:
+            position = bisect.bisect_right(self._starts, found) - 1
+            yield position
+            if position + 1 == len(self._starts):
+                break
+            # Continue with the next label
+            found = self._haystack.find(query, self._starts[position + 1])
+
+    def search(self, query, limit=100):
+        """Options matching `query`, the most relevant first.
+
+        Parameters
+        ----------
+        query : string
+            Text typed in the dropdown.
+        limit : int
+            Maximum number of options to return, None for all.
+
+        Returns
+        -------
+        list
+            Matching options, see the module docstring for the ranking.
+
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        ranked = []
+        seen = set()
+
+        def add(positions):
+            for ii in positions:
+                if limit is not None and len(ranked) >= limit:
+                    break
+                if ii not in seen:
+                    seen.add(ii)
+                    ranked.append(ii)
+
+        start, stop = _prefixed(self._names, query)
+        exact = bisect.bisect_right(self._names, query, lo=start, hi=stop)
+        add(self._name_positions[start:exact])
+        add(self._name_positions[exact:stop])
+        start, stop = _prefixed(self._words, query)
+        add(self._word_positions[start:stop])
+        add(self._substring(query))
+
+        options = [self.options[ii] for ii in ranked]
+        if not options and len(query) >= 3:
+            # Names close to the query. The dropdown filters its options in the
+            # browser, so the query is added to their search terms.
+            close = difflib.get_close_matches(
+                query, self._names, n=limit or len(self._names), cutoff=0.75
+            )
+            for name in close:
+                ii = self._name_positions[bisect.bisect_left(self._names, name)]
+                if ii not in seen:
+                    seen.add(ii)
+                    option = self.options[ii]
+                    options.append(
+                        dict(option, search="{} {}".format(option["search"], query))
+                    )
+        return options
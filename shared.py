@@ -0,0 +1,198 @@
+"""Data shared by all workers through memory-mapped files.
+
+Normally every gunicorn worker downloads, parses and holds its own copy of the
+data. When `COVID_SHARED_DIR` is set, the data is instead published once as
+.npy files to that directory and the workers memory-map them read-only. The
+pages are then held once in the page cache, no matter how many workers there
+are.
+
+Publishing is done by `python -m shared [directory]`, e.g. in a release phase, or by
+gunicorn at start-up, see gunicorn.conf.py. While running, one of the workers
+refreshes the data and publishes new versions, the others attach to them.
+
+Layout of the directory::
+
+    CURRENT             version of the latest complete data
+    refresh.lock        held by the worker loading or refreshing the data
+    <version>/          snapshots of the frames, see `snapshot`, and cube.npy,
+                        provinces_*.npy and us_*.npy if they were loaded
+"""
+import fcntl
+import logging
+import os
+import shutil
+import sys
+
+import numpy as np
+
+import config
+import data
+import snapshot
+from cube import Cube
+from regions import RegionStore
+
+
+logger = logging.getLogger(__name__)
+
+
+def _pointer(directory):
+    return os.path.join(directory, "CURRENT")
+
+
+def current_version(directory):
+    """Return the version published last in `directory`, None if none is."""
+    try:
+        with open(_pointer(directory)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def lock(directory, blocking=True):
+    """Lock `directory` for loading or refreshing the data.
+
+    Returns
+    -------
+    file or None
+        The open lock file, the lock is held until it is closed. None if
+        `blocking` is False and another process holds the lock.
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, "refresh.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def publish(dataset, directory, keep=2):
+    """Write `dataset` to `directory` and make it the current version.
+
+    Parameters
+    ----------
+    dataset : data.Dataset
+        Data to publish.
+    directory : string
+        Shared directory.
+    keep : int
+        Number of versions to keep. Older ones are removed, workers still
+        mapping them keep working as unlinked files stay readable.
+
+    """
+    version_dir = os.path.join(directory, dataset.version)
+    if not os.path.exists(os.path.join(version_dir, "cube.npy")):
+        snapshot.write_snapshot(dataset.confirmed, version_dir, "confirmed")
+        snapshot.write_snapshot(dataset.deaths, version_dir, "deaths")
+        snapshot.write_snapshot(
+            dataset.sheet.set_index("Statistikdatum"), version_dir, "sheet"
+        )
+        snapshot.write_snapshot(
+            dataset.wpp_population.to_frame(), version_dir, "wpp_population"
+        )
+        for prefix, store in [("provinces", dataset.provinces), ("us", dataset.us)]:
+            if store is not None:
+                _write_store(store, version_dir, prefix)
+        # The cube is written last, its presence marks a complete version
+        tmp_path = os.path.join(version_dir, "cube.tmp{}.npy".format(os.getpid()))
+        np.save(tmp_path, dataset.cube.values)
+        os.replace(tmp_path, os.path.join(version_dir, "cube.npy"))
+
+    tmp_pointer = _pointer(directory) + ".tmp{}".format(os.getpid())
+    with open(tmp_pointer, "w") as f:
+        f.write(dataset.version)
+    os.replace(tmp_pointer, _pointer(directory))
+    logger.info("Published data version %s to %s", dataset.version, directory)
+
+    versions = [
+        entry.name
+        for entry in os.scandir(directory)
+        if entry.is_dir() and entry.name != dataset.version
+    ]
+    versions.sort(key=lambda name: os.path.getmtime(os.path.join(directory, name)))
+    for name in versions[: max(0, len(versions) - keep + 1)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def attach(directory, version=None):
+    """Return the Dataset published in `directory`, as read-only views.
+
+    Parameters
+    ----------
+    directory : string
+        Shared directory.
+    version : string
+        Version to attach to, defaults to the current one.
+
+    Returns
+    -------
+    data.Dataset or None
+        None if nothing has been published yet.
+
+    """
+    if version is None:
+        version = current_version(directory)
+    if version is None:
+        return None
+
+    version_dir = os.path.join(directory, version)
+    frames = {
+        name: snapshot.read_snapshot(version_dir, name)
+        for name in ("confirmed", "deaths", "sheet", "wpp_population")
+    }
+    if any(frame is None for frame in frames.values()):
+        return None
+    sheet = frames["sheet"].rename_axis("Statistikdatum").reset_index()
+    wpp_population = frames["wpp_population"].iloc[:, 0]
+
+    values = np.load(os.path.join(version_dir, "cube.npy"), mmap_mode="r")
+    confirmed = frames["confirmed"]
+    cube = Cube.from_array(values, confirmed.index, confirmed.columns)
+
+    return data.Dataset(
+        confirmed,
+        frames["deaths"],
+        sheet,
+        wpp_population,
+        cube=cube,
+        version=version,
+        us=_read_store(version_dir, "us"),
+        provinces=_read_store(version_dir, "provinces"),
+    )
+
+
+def _write_store(store, version_dir, prefix):
+    for name in store.metrics:
+        snapshot.write_snapshot(store.frame(name), version_dir, prefix + "_" + name)
+    population = store.population_frame()
+    if population is not None:
+        snapshot.write_snapshot(population, version_dir, prefix + "_population")
+
+
+def _read_store(version_dir, prefix):
+    """The store published under `prefix`, None if it was not loaded."""
+    frames = {
+        name: snapshot.read_snapshot(version_dir, prefix + "_" + name)
+        for name in data.SERIES
+    }
+    if any(frame is None for frame in frames.values()):
+        return None
+    population = snapshot.read_snapshot(version_dir, prefix + "_population")
+    return RegionStore.from_frames(frames, population)
+
+
+def build(directory):
+    """Load the data from the sources, publish it to `directory` and attach."""
+    dataset = data.load()
+    publish(dataset, directory)
+    return attach(directory, dataset.version) or dataset
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    directory = sys.argv[1] if len(sys.argv) > 1 else config.SHARED_DIR
+    if not directory:
+        sys.exit("usage: python -m shared [directory], or set COVID_SHARED_DIR")
+    build(directory)
@@ -0,0 +1,194 @@
+"""On-disk snapshots of processed DataFrames.
+
+A snapshot consists of two files in the cache directory: `<name>.npy` holding
+the numeric values as one 2D array and `<name>.json`, a manifest with the
+index, the columns and the time the snapshot was written. The values are
+memory-mapped on load, so reading a snapshot costs almost nothing compared to
+downloading and parsing the original CSV files.
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# Bump when the layout of the files changes, old snapshots are then ignored
+FORMAT_VERSION = 2
+
+
+def _paths(cache_dir, name):
+    base = os.path.join(cache_dir, name)
+    return base + ".npy", base + ".json"
+
+
+def write_snapshot(df, cache_dir, name, **extra):
+    """Write `df` to a snapshot in `cache_dir`.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Frame with numeric values only.
+    cache_dir : string
+        Directory to write to, created if missing.
+    name : string
+        Name of the snapshot.
+    **extra
+        Additional JSON serializable entries stored in the manifest.
+
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    values_path, manifest_path = _paths(cache_dir, name)
+    values = np.ascontiguousarray(df.to_numpy())
+
+    if isinstance(df.index, pd.DatetimeIndex):
+        index_kind = "datetime"
+        index = list(df.index.strftime("%Y-%m-%d"))
+    else:
+        index_kind = "string"
+        index = [str(ii) for ii in df.index]
+
+    manifest = dict(
+        format_version=FORMAT_VERSION,
+        created=time.time(),
+        shape=list(values.shape),
+        dtype=values.dtype.str,
+        index_kind=index_kind,
+        index=index,
+        columns=[str(col) for col in df.columns],
+    )
+    manifest.update(extra)
+
+    # Write to temporary files first so readers never see partial files. The
+    # manifest goes last, it is what makes a snapshot visible.
+    tmp_suffix = ".tmp{}".format(os.getpid())
+    with open(values_path + tmp_suffix, "wb") as f:
+        np.save(f, values)
+    os.replace(values_path + tmp_suffix, values_path)
+    with open(manifest_path + tmp_suffix, "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + tmp_suffix, manifest_path)
+
+
+def read_manifest(cache_dir, name):
+    """Return the manifest of snapshot `name`, or None if there is none."""
+    _, manifest_path = _paths(cache_dir, name)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format_version") != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def snapshot_age(manifest):
+    """Seconds since the snapshot described by `manifest` was written."""
+    return time.time() - manifest["created"]
+
+
+def read_snapshot(cache_dir, name, max_age=None, mmap=True, source_key=None):
+    """Load snapshot `name` from `cache_dir`.
+
+    Parameters
+    ----------
+    cache_dir : string
+        Directory holding the snapshot.
+    name : string
+        Name of the snapshot.
+    max_age : float
+        Snapshots older than this many seconds are treated as missing. No limit
+        if None.
+    mmap : bool
+        Memory-map the values read-only instead of reading them into memory.
+    source_key : string
+        Snapshots written from a source with a different key, see `cached`,
+        are treated as missing. Not checked if None.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        The stored frame, or None if there is no usable snapshot.
+
+    """
+    manifest = read_manifest(cache_dir, name)
+    if manifest is None:
+        return None
+    if max_age is not None and snapshot_age(manifest) > max_age:
+        return None
+    if source_key is not None and manifest.get("source_key") != source_key:
+        return None
+
+    values_path, _ = _paths(cache_dir, name)
+    try:
+        values = np.load(values_path, mmap_mode="r" if mmap else None)
+    except (OSError, ValueError):
+        return None
+    # The values file is replaced before the manifest, so a mismatch means a
+    # writer is halfway through. Treat it as a miss.
+    if list(values.shape) != manifest["shape"]:
+        return None
+
+    if manifest["index_kind"] == "datetime":
+        index = pd.DatetimeIndex(manifest["index"])
+    else:
+        index = pd.Index(manifest["index"])
+    return pd.DataFrame(values, index=index, columns=manifest["columns"], copy=False)
+
+
+def cached(name, loader, cache_dir, ttl, source_key=None):
+    """Return the frame produced by `loader`, going through a snapshot.
+
+    The snapshot is used as long as it is younger than `ttl` seconds. When it
+    is older, or missing, `loader` is called and its result is written to a
+    new snapshot. If `loader` fails, e.g. when offline, a stale snapshot is
+    used rather than failing.
+
+    If the source can be identified cheaply, e.g. a local file by its content
+    hash, pass that as `source_key` instead of relying on the age. The
+    snapshot is then used, however old, as long as the key is unchanged.
+
+    Parameters
+    ----------
+    name : string
+        Name of the snapshot.
+    loader : callable
+        Called without arguments, returns a numeric DataFrame.
+    cache_dir : string
+        Directory holding the snapshots.
+    ttl : float
+        Maximum age of a snapshot in seconds, ignored if `source_key` is given.
+    source_key : string
+        Identifies the content of the source.
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    """
+    if source_key is None:
+        df = read_snapshot(cache_dir, name, max_age=ttl)
+    else:
+        df = read_snapshot(cache_dir, name, source_key=source_key)
+    if df is not None:
+        return df
+
+    try:
+        df = loader()
+    except Exception:
+        stale = read_snapshot(cache_dir, name)
+        if stale is None:
+            raise
+        return stale
+
+    extra = {} if source_key is None else dict(source_key=source_key)
+    try:
+        write_snapshot(df, cache_dir, name, **extra)
+    except OSError:
+        # A read-only file system should not stop the app from starting
+        return df
+    # Serve from the memory map so the parsed copy can be released
+    mapped = read_snapshot(cache_dir, name)
+    return df if mapped is None else mapped
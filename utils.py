@@ -1,22 +1,35 @@
+import io
+import os
+
 import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
-from datetime import datetime
 from pandas import ExcelWriter
 from pandas import ExcelFile
 
+import config
+import excel
+from fetch import fetch, is_local
+
 
-def get_xl_sheets(file, nbr_of_sheets=6):
+def get_xl_sheets(file, nbr_of_sheets=6, usecols=None, workers=1):
     """Returns a list of DataFrames where each DataFrame is a sheet of the excel
     file at `file`.
 
+    The file is opened once, see `excel.read_sheets`.
+
     Parameters
     ----------
-    file : string
-        Filename of, or path to, excel file.
+    file : string or file-like
+        Filename of, path to or URL of excel file, or anything else
+        `pandas.read_excel` accepts.
     nbr_of_sheets : type
         Number of sheets to extract from the excel file. Must be equal to or
         lower than the actual number of sheets in the file.
+    usecols : list or string
+        Columns to read from each sheet, all if None.
+    workers : int
+        Number of processes parsing the sheets in parallel.
 
     Returns
     -------
@@ -24,26 +37,60 @@ def get_xl_sheets(file, nbr_of_sheets=6):
         List of Dataframes.
 
     """
-    sheets = []
-    for ii in range(nbr_of_sheets):
-        sheet = pd.read_excel(file, ii)
-        sheets.append(sheet)
-    return sheets
+    sheets = range(nbr_of_sheets)
+    if isinstance(file, (str, os.PathLike)) and is_local(os.fspath(file)):
+        with open(file, 'rb') as f:
+            content = f.read()
+        return excel.read_sheets(content, sheets, usecols, workers)
+    # URLs and file objects, parsed one sheet after another
+    with pd.ExcelFile(file) as xl:
+        return [xl.parse(sheet, usecols=usecols) for sheet in sheets]
 
 
 width = 2
 
 
-def get_frame(name):
-    url = (
-        'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/'
-        f'csse_covid_19_time_series/time_series_covid19_{name}_global.csv')
-    return pd.read_csv(url, index_col='Country/Region')
+def get_frame(name, source=None):
+    """Read a JHU global time series CSV.
+
+    Parameters
+    ----------
+    name : string
+        Which time series to read, e.g. 'confirmed' or 'deaths'.
+    source : string
+        URL or local directory holding the CSV files. Defaults to
+        `config.DATA_URL`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Raw DataFrame indexed by country.
+
+    """
+    timeout = config.FETCH_TIMEOUTS.get(name, config.FETCH_TIMEOUT)
+    content, _ = fetch(series_url(name, source), timeout=timeout)
+    return pd.read_csv(io.BytesIO(content), index_col='Country/Region')
+
+
+def series_url(name, source=None):
+    """Return the location of the JHU global time series `name`."""
+    if source is None:
+        source = config.DATA_URL
+    return f'{source}/time_series_covid19_{name}_global.csv'
+
+
+def us_series_url(name, source=None):
+    """Return the location of the JHU US time series `name`, by county."""
+    if source is None:
+        source = config.DATA_URL
+    return f'{source}/time_series_covid19_{name}_US.csv'
 
 
 def process_df(df):
     """Process DataFrame read from COVID-19 database
 
+    Rows belonging to the same country, e.g. its provinces, are summed up.
+
     Parameters
     ----------
     df : pandas.DataFrame
@@ -51,22 +98,47 @@ def process_df(df):
     Returns
     -------
     pandas.DataFrame
-        processed DataFrame
+        processed DataFrame with a DatetimeIndex
 
     """
-    df.pop('Province/State')
-    df.pop('Lat')
-    df.pop('Long')
-    data_dict = {}
-
-    for country in df.index.unique():
-        if len(df.loc[country].shape) > 1:
-            sum = df.loc[country].sum()
-        else:
-            sum = df.loc[country]
-        data_dict[country] = sum
+    df = df.drop(columns=['Province/State', 'Lat', 'Long'])
+    countries, sums = sum_by_key(df.to_numpy(), df.index)
+    return pd.DataFrame(sums.T, index=parse_dates(df.columns), columns=countries)
+
+
+def sum_by_key(values, keys):
+    """Sum the rows of `values` that share the same key.
 
-    return pd.DataFrame(data_dict)
+    Missing values are skipped, as in `pandas.DataFrame.sum`, except for keys
+    with only one row which are returned as is.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        2D array with one row per key in `keys`.
+    keys : array-like
+        Key of each row.
+
+    Returns
+    -------
+    tuple
+        Array of the unique keys in order of first appearance and a 2D array
+        with the summed rows in the same order.
+
+    """
+    codes, uniques = pd.factorize(np.asarray(keys))
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(uniques)))
+    sorted_values = values[order]
+
+    if sorted_values.dtype.kind == 'f':
+        counts = np.bincount(codes, minlength=len(uniques))
+        sums = np.add.reduceat(np.nan_to_num(sorted_values), starts, axis=0)
+        single = counts == 1
+        sums[single] = sorted_values[starts[single]]
+    else:
+        sums = np.add.reduceat(sorted_values, starts, axis=0)
+    return uniques, sums
 
 
 def get_df(file_path):
@@ -75,18 +147,38 @@ def get_df(file_path):
     return df
 
 
+def parse_dates(stamps):
+    """Parse JHU date stamps, e.g. '1/22/20' or '1/22/2020'.
+
+    Parameters
+    ----------
+    stamps : array-like
+        Date strings in either of the formats `%m/%d/%y` or `%m/%d/%Y`.
+
+    Returns
+    -------
+    pandas.DatetimeIndex
+
+    """
+    stamps = pd.Index(stamps).astype(str)
+    long_year = stamps.str.rsplit('/', n=1).str[-1].str.len() == 4
+    dates = pd.Series(pd.NaT, index=range(len(stamps)), dtype='datetime64[ns]')
+    dates[~long_year] = pd.to_datetime(stamps[~long_year], format='%m/%d/%y')
+    dates[long_year] = pd.to_datetime(stamps[long_year], format='%m/%d/%Y')
+    return pd.DatetimeIndex(dates)
+
+
+def iso_dates(index):
+    """Return the dates in `index` as a list of ISO 8601 strings.
+
+    Serializing dates to JSON is expensive, so this is done once per index and
+    the result is passed on to the figures.
+    """
+    return list(index.strftime('%Y-%m-%d'))
+
+
 def datetimeify(ind):
-    date_list = []
-    for ii, stamp in enumerate(ind):
-        if len(stamp.split('/')[0]) == 1:
-            stamp = '0' + stamp
-        try:
-            date = datetime.strptime(stamp, '%m/%d/%Y')
-        except ValueError:
-            date = datetime.strptime(stamp, '%m/%d/%y')
-
-        date_list.append(date)
-    return date_list
+    return list(parse_dates(ind).to_pydatetime())
 
 
 def total_vs_time(df, descr):